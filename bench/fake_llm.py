@@ -0,0 +1,166 @@
+# bench/fake_llm.py
+"""
+Deterministic stand-in for the OpenAI chat completions API.
+
+Answers every POST /v1/chat/completions (streaming or not) with a fixed,
+prompt-derived text after a configurable delay, so the full pipeline can be
+benchmarked offline. The reply always starts with crewai's final-answer
+marker, which makes ReAct agents finish in one step. With --fail-every N,
+every Nth request is rejected with HTTP 429 to exercise client retries.
+
+Usage:
+    python -m bench.fake_llm --port 8765 --latency 0.4 --tokens 120 --token-delay 0.005
+    export OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake
+    # or only for the fast model: export LLM_FAST_BASE_URL=http://127.0.0.1:8765/v1
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "compute talent policy funding adoption research sovereign models capacity roadmap "
+    "startups commercialization productivity infrastructure investment strategy"
+).split()
+
+
+def fake_completion(messages: List[dict], n_tokens: int) -> str:
+    """Deterministic reply whose words depend only on the prompt."""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+    words = [WORDS[seed[i % len(seed)] % len(WORDS)] for i in range(n_tokens)]
+    return "Thought: I now can give a great answer\nFinal Answer: " + " ".join(words) + "."
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.5        # seconds before the first token
+    token_delay = 0.0    # seconds between streamed tokens
+    n_tokens = 100
+    fail_every = 0       # reject every Nth request with 429 (0 = never)
+    _requests = 0
+    _requests_lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+        if self._should_fail():
+            return self._json(429, {"error": {"message": "rate limited (fake)", "type": "rate_limit_error"}})
+        messages = body.get("messages", [])
+        text = fake_completion(messages, self.n_tokens)
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        completion_tokens = len(text.split())
+        model = body.get("model", "gpt-4o-mini")
+        created = int(time.time())
+        time.sleep(self.latency)
+
+        if not body.get("stream"):
+            return self._json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        tokens = text.split(" ")
+        for i, token in enumerate(tokens):
+            delta = {"content": token if i == 0 else " " + token}
+            if i == 0:
+                delta["role"] = "assistant"
+            self._event({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            if self.token_delay:
+                time.sleep(self.token_delay)
+        self._event({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [],
+                         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                   "total_tokens": prompt_tokens + completion_tokens}})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _should_fail(self) -> bool:
+        if not self.fail_every:
+            return False
+        cls = type(self)
+        with cls._requests_lock:
+            cls._requests += 1
+            return cls._requests % self.fail_every == 0
+
+    def _event(self, payload: dict) -> None:
+        self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+    def _json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 0, latency: float = 0.5, token_delay: float = 0.0, n_tokens: int = 100,
+                 host: str = "127.0.0.1", fail_every: int = 0) -> ThreadingHTTPServer:
+    """Start the fake server on a daemon thread; port 0 picks a free port."""
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {
+        "latency": latency, "token_delay": token_delay, "n_tokens": n_tokens, "fail_every": fail_every,
+        "_requests": 0, "_requests_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Deterministic fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=100, help="words per completion")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with HTTP 429")
+    args = parser.parse_args(argv)
+    server = start_server(args.port, args.latency, args.token_delay, args.tokens, args.host, args.fail_every)
+    print(f"Fake LLM listening on {base_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
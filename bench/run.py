@@ -0,0 +1,273 @@
+# bench/run.py
+"""
+End-to-end latency benchmark for the RAG pipeline.
+
+Runs against a local fake LLM (bench/fake_llm.py) unless --real-llm is given,
+so it works offline and LLM latency is a fixed, known quantity. Scenarios:
+
+- cold:       fresh interpreter; time to import crew.main and answer one query
+- warm:       one query at a time with warm resources; per-stage latency for
+              embed, retrieval (the production path: routing, search and
+              rerank), prompt assembly and the LLM call(s)
+- concurrent: many queries through QueryService at a fixed concurrency
+
+Each stage reports p50/p95/p99/mean (seconds) and each scenario its
+throughput. Results are written as JSON (tagged with the git commit) and can
+be compared with an earlier run to catch regressions:
+
+    python -m bench.run --out bench/results/new.json --compare bench/results/old.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+QUERIES = [
+    "What is Canada's position relative to global AI leaders?",
+    "What determines national AI competitiveness?",
+    "Outline the implementation roadmap phases from 0 to 60+ months.",
+    "What policy levers improve AI compute infrastructure?",
+    "How does the brain drain affect AI research capacity?",
+    "What is the commercialization gap for AI startups?",
+    "How is venture capital funding for AI distributed?",
+    "Which sectors benefit most from AI adoption?",
+]
+
+
+# =========================
+# Statistics
+# =========================
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in [0, 100])."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        stage: {
+            "n": len(values),
+            "mean": sum(values) / len(values) if values else 0.0,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+        for stage, values in samples.items()
+    }
+
+
+def _timed(samples: Dict[str, List[float]], stage: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+
+# =========================
+# Scenarios
+# =========================
+
+def bench_cold(runs: int) -> Dict:
+    """Time imports and the first query in fresh interpreters."""
+    samples: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.run", "--cold-probe"],
+            cwd=PROJECT_ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+        ).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        for stage, seconds in probe.items():
+            samples.setdefault(stage, []).append(seconds)
+    return {"stages": summarize(samples)}
+
+
+def cold_probe() -> None:
+    """Child process of bench_cold(): print one JSON line of timings."""
+    timings = {}
+    start = time.perf_counter()
+    from crew.main import kickoff_query
+    from crew.tasks import DOMAIN_DIRECTIVES
+    timings["import"] = time.perf_counter() - start
+    first = time.perf_counter()
+    kickoff_query(QUERIES[0], DOMAIN_DIRECTIVES["general"], use_cache=False, mode="direct")
+    timings["first_query"] = time.perf_counter() - first
+    timings["total"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def bench_warm(iterations: int, include_crew: bool) -> Dict:
+    """Sequential queries with warm resources, timed stage by stage."""
+    from crew.llm import chat
+    from crew.main import run_crew
+    from crew.tasks import DOMAIN_DIRECTIVES, build_direct_messages
+    from crew.tools import format_context, retrieve_documents
+    from rag.retriever import get_embeddings, invalidate_query_caches, warm_up
+
+    warm_up(background=False)
+    directive = DOMAIN_DIRECTIVES["general"]
+    samples: Dict[str, List[float]] = {}
+    started = time.perf_counter()
+    for i in range(iterations):
+        query = QUERIES[i % len(QUERIES)]
+        invalidate_query_caches()  # measure the real encoder and search, not the memo
+        t0 = time.perf_counter()
+        _timed(samples, "embed", get_embeddings().embed_query, query)
+        # Same retrieval as the direct path; the query vector just computed is reused from the memo
+        docs = _timed(samples, "retrieve", retrieve_documents, query, directive)
+        messages = _timed(samples, "prompt_assembly", build_direct_messages,
+                          query, directive, format_context(docs))
+        _timed(samples, "llm_direct", chat, messages)
+        samples.setdefault("total_direct", []).append(time.perf_counter() - t0)
+        if include_crew:
+            _timed(samples, "total_crew", run_crew, query, directive)
+    elapsed = time.perf_counter() - started
+    return {"stages": summarize(samples), "throughput_qps": iterations / elapsed}
+
+
+def bench_concurrent(requests: int, concurrency: int) -> Dict:
+    """Push `requests` distinct queries through QueryService at `concurrency`."""
+    from crew.service import QueryService
+    from crew.tasks import DOMAIN_DIRECTIVES
+    from rag.retriever import invalidate_query_caches, warm_up
+
+    warm_up(background=False)
+    invalidate_query_caches()
+    directive = DOMAIN_DIRECTIVES["general"]
+
+    async def run() -> Dict:
+        service = QueryService(max_concurrency=concurrency, max_queued=requests + 1, queue_timeout=None)
+        # Suffixes keep queries distinct so in-flight dedup does not merge them
+        queries = [f"{QUERIES[i % len(QUERIES)]} (#{i})" for i in range(requests)]
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(
+                service.run(q, directive, mode="direct", use_cache=False) for q in queries
+            ))
+        finally:
+            await service.aclose()
+        elapsed = time.perf_counter() - started
+        samples: Dict[str, List[float]] = {}
+        for result in results:
+            for stage, seconds in result.timings.items():
+                samples.setdefault(stage, []).append(seconds)
+        return {"stages": summarize(samples), "throughput_qps": requests / elapsed,
+                "concurrency": concurrency}
+
+    return asyncio.run(run())
+
+
+# =========================
+# Reporting
+# =========================
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """p95 regressions larger than `tolerance` (fraction) versus `baseline`."""
+    regressions = []
+    for scenario, result in current["scenarios"].items():
+        old_stages = baseline.get("scenarios", {}).get(scenario, {}).get("stages", {})
+        for stage, stats in result["stages"].items():
+            old = old_stages.get(stage)
+            if old and old["p95"] > 0 and stats["p95"] > old["p95"] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario}/{stage}: p95 {old['p95'] * 1000:.1f}ms -> {stats['p95'] * 1000:.1f}ms"
+                )
+    return regressions
+
+
+def print_report(results: Dict) -> None:
+    for scenario, result in results["scenarios"].items():
+        extra = f"  ({result['throughput_qps']:.2f} q/s)" if "throughput_qps" in result else ""
+        print(f"\n== {scenario}{extra}")
+        for stage, stats in result["stages"].items():
+            print(f"  {stage:<16} p50 {stats['p50'] * 1000:9.1f}ms  p95 {stats['p95'] * 1000:9.1f}ms"
+                  f"  p99 {stats['p99'] * 1000:9.1f}ms  n={stats['n']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark for the RAG crew")
+    parser.add_argument("--scenarios", default="cold,warm,concurrent", help="comma-separated subset")
+    parser.add_argument("--iterations", type=int, default=20, help="warm queries")
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=40, help="concurrent-scenario queries")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--crew", action="store_true", help="also time the full two-agent crew (warm)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake LLM seconds to first token")
+    parser.add_argument("--llm-tokens", type=int, default=100, help="fake LLM words per completion")
+    parser.add_argument("--real-llm", action="store_true", help="use the configured OpenAI endpoint")
+    parser.add_argument("--out", default=None, help="results JSON (default: bench/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="baseline results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown (fraction)")
+    parser.add_argument("--cold-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cold_probe:
+        cold_probe()
+        return 0
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ["ANSWER_CACHE"] = "0"
+    os.environ["LLM_CACHE"] = "0"
+    if not args.real_llm:
+        from bench.fake_llm import base_url, start_server
+        server = start_server(latency=args.llm_latency, n_tokens=args.llm_tokens)
+        os.environ["OPENAI_BASE_URL"] = os.environ["OPENAI_API_BASE"] = base_url(server)
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "cold_probe")},
+        "scenarios": {},
+    }
+    if "cold" in scenarios:
+        results["scenarios"]["cold"] = bench_cold(args.cold_runs)
+    if "warm" in scenarios:
+        results["scenarios"]["warm"] = bench_warm(args.iterations, args.crew)
+    if "concurrent" in scenarios:
+        results["scenarios"]["concurrent"] = bench_concurrent(args.requests, args.concurrency)
+
+    out = args.out or os.path.join(PROJECT_ROOT, "bench", "results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print_report(results)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions (p95):\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nNo p95 regressions beyond tolerance.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
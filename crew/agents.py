@@ -1,7 +1,12 @@
+import os
+
 from crewai import Agent
-from crew.llm import chatgpt_llm
+from crew.llm import answer_llm, fast_llm
 from crew.tools import retrieve_context, retrieve_citations, summarize_text, extract_keywords
 
+# Step-by-step agent console output; set CREW_VERBOSE=0 in production
+VERBOSE = os.getenv("CREW_VERBOSE", "1") != "0"
+
 policy_analyst = Agent(
     role="Senior Policy Researcher",
     goal=(
@@ -12,9 +17,9 @@ policy_analyst = Agent(
         "You are a meticulous researcher for the Canada AI Strategy project. "
         "Your job is to find the ground truth in the 'Maple Protocol' PDF."
     ),
-    llm=chatgpt_llm,
+    llm=fast_llm,
     tools=[retrieve_context],
-    verbose=True,
+    verbose=VERBOSE,
     allow_delegation=False,
     max_iter=2,
 )
@@ -30,7 +35,7 @@ domain_expert = Agent(
     "You are familiar with the Maple Protocol (Canada's AI strategy proposal), but you only focus on Canada "
     "when the user asks about Canada or the Maple Protocol specifically."
     ),
-    llm=chatgpt_llm,
-    verbose=True,
+    llm=answer_llm,
+    verbose=VERBOSE,
     allow_delegation=False,
 )
@@ -0,0 +1,138 @@
+# crew/api.py
+"""
+Minimal headless HTTP API exposing the kickoff_query contract.
+
+    POST /query   {"query": "...", "domain": "policy", "mode": "direct", "session_id": "..."}
+                  ("domain_directive" may be sent instead of "domain"; "session_id"
+                  is optional and enables follow-up questions)
+        -> 200 {"answer", "mode", "cached", "standalone_query", "chunk_ids", "timings"}
+           400 bad request (including a negative or over-limit Content-Length),
+           503 service busy, 504 timed out
+    GET  /health  -> 200 {"status": "ok", "queued": n, "in_flight": n, "abandoned_runs": n}
+    GET  /metrics -> 200 Prometheus text exposition (see rag/tracing.py)
+
+Requests run on the shared QueryService, so the API and the Streamlit app get
+the same concurrency limit, queueing and in-flight dedup.
+
+Usage:
+    python -m crew.api --host 127.0.0.1 --port 8000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crew.main import QUERY_MODES
+from crew.service import ServiceBusy, get_query_service
+from crew.tasks import get_directive
+from rag.tracing import render_metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+# Optional request fields and the types they must have when present
+_FIELD_TYPES = {
+    "domain": str,
+    "domain_directive": str,
+    "mode": str,
+    "session_id": str,
+    "use_cache": bool,
+}
+
+
+def _validate(payload) -> dict:
+    """Check the shape of a /query body; raises ValueError (-> 400) on a bad request."""
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("'query' must be a non-empty string")
+    for name, expected in _FIELD_TYPES.items():
+        value = payload.get(name)
+        if value is not None and not isinstance(value, expected):
+            raise ValueError(f"'{name}' must be a {'boolean' if expected is bool else 'string'}")
+    if payload.get("mode") is not None and payload["mode"] not in QUERY_MODES:
+        raise ValueError(f"'mode' must be one of {', '.join(QUERY_MODES)}")
+    return payload
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server_version = "MapleProtocolAPI/1.0"
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            return self._send_text(200, render_metrics())
+        if self.path != "/health":
+            return self._send(404, {"error": "not found"})
+        stats = get_query_service().service.stats()
+        self._send(200, {"status": "ok", **stats})
+
+    def do_POST(self):
+        if self.path != "/query":
+            return self._send(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            if not 0 <= length <= MAX_BODY_BYTES:
+                raise ValueError(f"Content-Length must be between 0 and {MAX_BODY_BYTES} bytes")
+            payload = _validate(json.loads(self.rfile.read(length) or b"{}"))
+            directive = payload.get("domain_directive") or get_directive(payload.get("domain", "general"))
+            result = get_query_service().run(
+                payload["query"], directive,
+                mode=payload.get("mode"),
+                use_cache=payload.get("use_cache", True),
+                session_id=payload.get("session_id"),
+            )
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        except ServiceBusy as e:
+            return self._send(503, {"error": str(e)})
+        except (TimeoutError, asyncio.TimeoutError):
+            return self._send(504, {"error": "query timed out"})
+        except Exception as e:
+            logger.exception("Query failed")
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send(200, asdict(result))
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status: int, text: str) -> None:
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000) -> None:
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    logger.info(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Headless HTTP API for kickoff_query")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.host, args.port)
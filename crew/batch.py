@@ -0,0 +1,143 @@
+# crew/batch.py
+"""
+JSONL batch runner for evaluation sets and offline jobs.
+
+Each input line is a record like {"query": "...", "domain": "policy"}; "domain"
+is a DOMAIN_DIRECTIVES key (default "general") and an optional "id" names the
+record (otherwise a hash of domain + query is used). Records are answered
+through QueryService with bounded parallelism, and every result is appended to
+the output JSONL as soon as it finishes:
+
+    {"id", "query", "domain", "mode", "answer", "cached", "chunk_ids", "timings", "error"}
+
+Records already present in the output without an error are skipped, so an
+interrupted run resumes where it stopped (failed records are retried).
+
+Usage:
+    python -m crew.batch questions.jsonl answers.jsonl --parallelism 4 [--mode crew] [--no-cache]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional, Set
+
+from crew.service import QueryService
+from crew.tasks import get_directive
+
+logger = logging.getLogger(__name__)
+
+
+def record_id(record: Dict) -> str:
+    """Stable identifier for an input record."""
+    if record.get("id") is not None:
+        return str(record["id"])
+    key = f"{record.get('domain', 'general')}\n{record['query']}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def load_records(path: str) -> List[Dict]:
+    """Read input records, skipping blank lines."""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get("query"):
+                raise ValueError(f"{path}:{line_no}: record has no 'query'")
+            record.setdefault("domain", "general")
+            record["id"] = record_id(record)
+            records.append(record)
+    return records
+
+
+def completed_ids(path: str) -> Set[str]:
+    """IDs already answered successfully in an existing output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            if not row.get("error"):
+                done.add(row["id"])
+    return done
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    parallelism: int = 4,
+    mode: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, int]:
+    """Answer every pending record in `input_path`, appending results to `output_path`."""
+    if parallelism < 1:
+        raise ValueError(f"parallelism must be at least 1, got {parallelism}")
+    records = load_records(input_path)
+    done = completed_ids(output_path)
+    todo = [r for r in records if r["id"] not in done]
+    logger.info(f"{len(records)} record(s), {len(records) - len(todo)} already done, {len(todo)} to run")
+
+    # Everything is queued up front, so the line must hold the whole batch and never time out
+    service = QueryService(max_concurrency=parallelism, max_queued=len(todo) + 1, queue_timeout=None)
+
+    async def one(record: Dict) -> Dict:
+        row = {"id": record["id"], "query": record["query"], "domain": record["domain"]}
+        try:
+            result = await service.run(record["query"], get_directive(record["domain"]),
+                                       mode=mode, use_cache=use_cache)
+            row.update(asdict(result), error=None)
+        except Exception as e:
+            logger.warning(f"Record {record['id']} failed: {e}")
+            row["error"] = f"{type(e).__name__}: {e}"
+        return row
+
+    counts = {"ok": 0, "failed": 0, "skipped": len(records) - len(todo)}
+    started = time.perf_counter()
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            for finished in asyncio.as_completed([one(r) for r in todo]):
+                row = await finished
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["failed" if row["error"] else "ok"] += 1
+    finally:
+        await service.aclose()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Finished in {elapsed:.1f}s: {counts}")
+    return counts
+
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of {query, domain} records")
+    parser.add_argument("input", help="input JSONL")
+    parser.add_argument("output", help="output JSONL (appended to; existing answers are skipped)")
+    parser.add_argument("--parallelism", type=_positive_int, default=4, help="queries executed concurrently")
+    parser.add_argument("--mode", choices=["direct", "crew"], default=None, help="default: $QUERY_MODE")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the semantic answer cache")
+    args = parser.parse_args()
+    asyncio.run(run_batch(args.input, args.output, args.parallelism, args.mode, not args.no_cache))
@@ -0,0 +1,273 @@
+# crew/cache.py
+"""
+Semantic answer cache in front of kickoff_query().
+
+Answers are keyed on (normalized query embedding, query mode, domain
+directive, corpus version). A lookup first tries an exact match on the
+normalized query text, then serves any cached answer whose query embedding has
+a cosine similarity above `threshold` with the new query and that names the
+same numbers and entities. Embeddings barely move between "phase 1" and
+"phase 2", or between two provinces, so those questions never share an answer
+unless their text matches exactly. Two tiers:
+
+- an in-memory LRU (fast, per process)
+- a SQLite table in data/ (persistent, shared by all processes)
+
+Entries expire after `ttl_seconds`; both tiers are LRU-bounded.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from rag.retriever import DATA_DIR, corpus_version, get_embeddings
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.join(DATA_DIR, "answer_cache.sqlite3")
+
+CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") != "0"
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_MEMORY_ENTRIES = 256
+MAX_DISK_ENTRIES = 5000
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", query.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _scope_key(domain_directive: str, mode: str) -> str:
+    return _digest(f"{mode}\n{domain_directive}")
+
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_NAME = re.compile(r"\b[A-Z][\w'-]*")
+
+
+def query_anchors(query: str) -> str:
+    """Numbers and capitalised names in `query` (bar its first word), as a sorted key.
+
+    Near-duplicate matches must agree on these exactly.
+    """
+    text = query.strip()
+    first = text.split(" ", 1)[0]
+    names = {m.group().lower() for m in _NAME.finditer(text) if m.start() > len(first) and m.group() != "I"}
+    numbers = set(_NUMBER.findall(text))
+    return " ".join(sorted(numbers | names))
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray
+    anchors: str
+    answer: str
+    created_at: float
+
+
+class AnswerCache:
+    """Two-tier (memory LRU + SQLite) semantic cache of final answers."""
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: float = TTL_SECONDS,
+        max_memory_entries: int = MAX_MEMORY_ENTRIES,
+        max_disk_entries: int = MAX_DISK_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                directive_key  TEXT NOT NULL,
+                corpus_version TEXT NOT NULL,
+                query_key      TEXT NOT NULL,
+                query          TEXT NOT NULL,
+                vector         BLOB NOT NULL,
+                answer         TEXT NOT NULL,
+                created_at     REAL NOT NULL,
+                last_used      REAL NOT NULL,
+                PRIMARY KEY (directive_key, corpus_version, query_key)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._db.commit()
+
+    # ---------- public API ----------
+
+    def lookup(self, query: str, domain_directive: str, mode: str) -> Optional[str]:
+        """Return a cached `mode` answer for `query` (or a near-duplicate), else None."""
+        normalized = normalize_query(query)
+        scope = (_scope_key(domain_directive, mode), corpus_version())
+        query_key = _digest(normalized)
+        anchors = query_anchors(query)
+        now = time.time()
+
+        with self._lock:
+            answer = self._memory_lookup(scope, query_key, None, anchors, now)
+            if answer is not None:
+                self._metrics["memory_hits"] += 1
+                return answer
+
+        vector = self._embed(normalized)
+        with self._lock:
+            answer = self._memory_lookup(scope, query_key, vector, anchors, now)
+            if answer is not None:
+                self._metrics["memory_hits"] += 1
+                return answer
+            answer = self._disk_lookup(scope, query_key, vector, anchors, now)
+            if answer is not None:
+                self._metrics["disk_hits"] += 1
+                return answer
+            self._metrics["misses"] += 1
+        return None
+
+    def store(self, query: str, domain_directive: str, mode: str, answer: str) -> None:
+        """Cache the `mode` answer for `query` under the current corpus version."""
+        normalized = normalize_query(query)
+        scope = (_scope_key(domain_directive, mode), corpus_version())
+        query_key = _digest(normalized)
+        anchors = query_anchors(query)
+        vector = self._embed(normalized)
+        now = time.time()
+
+        with self._lock:
+            self._remember(scope + (query_key,), _Entry(vector, anchors, answer, now))
+            # `query` keeps the original text so anchors can be recomputed on disk hits
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*scope, query_key, query.strip(), vector.tobytes(), answer, now, now),
+            )
+            self._db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM answers WHERE rowid IN ("
+                " SELECT rowid FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self._db.commit()
+            self._metrics["stores"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters plus the overall hit rate."""
+        with self._lock:
+            stats: Dict[str, float] = dict(self._metrics)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    # ---------- internals ----------
+
+    @staticmethod
+    def _embed(normalized_query: str) -> np.ndarray:
+        # STEmbeddings already returns L2-normalised vectors, so dot product == cosine
+        return np.asarray(get_embeddings().embed_query(normalized_query), dtype=np.float32)
+
+    def _remember(self, key: Tuple[str, str, str], entry: _Entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _memory_lookup(self, scope, query_key, vector, anchors, now) -> Optional[str]:
+        """Exact match when `vector` is None, otherwise best same-anchor match above the threshold."""
+        exact = self._memory.get(scope + (query_key,))
+        if exact is not None and now - exact.created_at <= self.ttl_seconds:
+            self._memory.move_to_end(scope + (query_key,))
+            return exact.answer
+        if vector is None:
+            return None
+
+        best_key, best_score = None, self.threshold
+        for key, entry in list(self._memory.items()):
+            if now - entry.created_at > self.ttl_seconds:
+                del self._memory[key]
+                continue
+            if key[:2] != scope or entry.anchors != anchors:
+                continue
+            score = float(np.dot(entry.vector, vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        self._memory.move_to_end(best_key)
+        return self._memory[best_key].answer
+
+    def _disk_lookup(self, scope, query_key, vector, anchors, now) -> Optional[str]:
+        rows = self._db.execute(
+            "SELECT query_key, query, vector, answer, created_at FROM answers"
+            " WHERE directive_key = ? AND corpus_version = ? AND created_at >= ?",
+            (*scope, now - self.ttl_seconds),
+        ).fetchall()
+        if not rows:
+            return None
+        row_anchors = [query_anchors(row[1]) for row in rows]
+        matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        scores = matrix @ vector
+        for i, row in enumerate(rows):
+            if row[0] == query_key:
+                scores[i] = np.inf
+            elif row_anchors[i] != anchors:
+                scores[i] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        row_key, _, _, answer, created_at = rows[best]
+        self._db.execute(
+            "UPDATE answers SET last_used = ? WHERE directive_key = ? AND corpus_version = ? AND query_key = ?",
+            (now, *scope, row_key),
+        )
+        self._db.commit()
+        self._remember(scope + (row_key,), _Entry(matrix[best].copy(), row_anchors[best], answer, created_at))
+        return answer
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide AnswerCache, or None when disabled with ANSWER_CACHE=0."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
@@ -1,10 +1,505 @@
 # crew/llm.py
+"""
+LLM configuration, model routing and the shared OpenAI call path.
+
+Two model roles:
+
+- "answer": the final answer (domain expert agent, direct RAG), from
+  $LLM_ANSWER_MODEL (default openai/gpt-4o-mini, temperature 0.2)
+- "fast": cheap, deterministic steps (query rewriting, conversation summaries,
+  the researcher's gather summary), from $LLM_FAST_MODEL (default
+  openai/gpt-4o-mini, even when the answer model is changed) at temperature 0
+
+Each role can point at its own OpenAI-compatible endpoint
+($LLM_ANSWER_BASE_URL, $LLM_FAST_BASE_URL; default $OPENAI_BASE_URL), e.g. a
+local server for the fast model or bench/fake_llm.py for offline tests.
+
+Direct calls (chat, stream_chat, achat, astream_chat) share one place for
+timeouts and retries (set on the pooled clients), a process-wide request rate
+limit, and a persistent exact-call response cache keyed by
+(model, messages, params). The agents' own calls go through the same rate
+limit and cache (see route_agent_calls).
+"""
+
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
 from crewai import LLM
 
-chatgpt_llm = LLM(
-    model="openai/gpt-4o-mini",
-    temperature=0.2,
+from rag.tokens import count_tokens
+from rag.tracing import inc, record_llm_call
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# Model routing
+# =========================
+
+ANSWER_MODEL = os.getenv("LLM_ANSWER_MODEL", "openai/gpt-4o-mini")
+ANSWER_TEMPERATURE = float(os.getenv("LLM_ANSWER_TEMPERATURE", "0.2"))
+FAST_MODEL = os.getenv("LLM_FAST_MODEL", "openai/gpt-4o-mini")
+ANSWER_BASE_URL = os.getenv("LLM_ANSWER_BASE_URL") or None
+FAST_BASE_URL = os.getenv("LLM_FAST_BASE_URL") or None
+
+# Applied to every direct call; crewai's agents get the same timeout
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# LLM requests per second across the process, direct and agent calls (0 = unlimited)
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0"))
+
+answer_llm = LLM(
+    model=ANSWER_MODEL,
+    temperature=ANSWER_TEMPERATURE,
+    base_url=ANSWER_BASE_URL,
+    timeout=LLM_TIMEOUT,
 )
+
+fast_llm = LLM(
+    model=FAST_MODEL,
+    temperature=0.0,
+    base_url=FAST_BASE_URL,
+    timeout=LLM_TIMEOUT,
+)
+
+# Older name for the answer model
+chatgpt_llm = answer_llm
+
+# Which role each traced step runs on
+ROLE_BY_AGENT = {
+    "direct": "answer",
+    "rewrite": "fast",
+    "summarize": "fast",
+    "gather": "fast",
+}
+
+
+def get_llm(role: str) -> LLM:
+    """The LLM for a model role ("answer" or "fast")."""
+    if role == "answer":
+        return answer_llm
+    if role == "fast":
+        return fast_llm
+    raise ValueError(f"Unknown model role {role!r}; expected 'answer' or 'fast'")
+
+
+def llm_for(agent: str) -> LLM:
+    """The LLM a traced step (`agent`) is routed to; unknown steps use the answer model."""
+    return get_llm(ROLE_BY_AGENT.get(agent, "answer"))
+
+
+# =========================
+# Clients, retries and rate limit
+# =========================
+
+# Size of the keep-alive connection pool used for direct OpenAI calls
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+_clients: Dict[Optional[str], object] = {}
+_client_lock = threading.Lock()
+
+
+def _api_model(llm: LLM) -> str:
+    """crewai model names carry a provider prefix ("openai/..."); the OpenAI API does not."""
+    return llm.model.split("/", 1)[1] if llm.model.startswith("openai/") else llm.model
+
+
+def _base_url(llm: LLM) -> Optional[str]:
+    return getattr(llm, "base_url", None) or None
+
+
+def get_openai_client(base_url: Optional[str] = None):
+    """Process-wide OpenAI client per endpoint, so every call reuses one pooled HTTP connection set."""
+    client = _clients.get(base_url)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                import httpx
+                from openai import DefaultHttpxClient, OpenAI
+                client = _clients[base_url] = OpenAI(
+                    base_url=base_url,
+                    timeout=LLM_TIMEOUT,
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=DefaultHttpxClient(
+                        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                            max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                    ),
+                )
+    return client
+
+
+def make_async_client(base_url: Optional[str] = ANSWER_BASE_URL):
+    """
+    New AsyncOpenAI client with a pooled HTTP transport.
+
+    Async clients are tied to the event loop that first uses them, so each
+    event loop (e.g. the one owned by crew.service.QueryService) creates its own.
+    """
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return AsyncOpenAI(
+        base_url=base_url,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        ),
+    )
+
+
+class RateLimiter:
+    """Spaces requests at most `rate` per second apart (shared by threads and event loops)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Claim the next free slot; returns how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+            return slot - now
+
+    def wait(self) -> None:
+        if self.rate > 0:
+            delay = self._reserve()
+            if delay > 0:
+                time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        if self.rate > 0:
+            delay = self._reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter(LLM_RATE_LIMIT)
+
+
+# =========================
+# Response cache
+# =========================
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "data", "llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = 20000
+
+
+class LLMResponseCache:
+    """Persistent exact-call cache: identical (model, messages, params) return the stored completion."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key        TEXT PRIMARY KEY,
+                model      TEXT NOT NULL,
+                response   TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self._db.commit()
+
+    @staticmethod
+    def key(llm: LLM, messages: List[dict], params: Optional[dict] = None) -> str:
+        payload = {
+            "model": llm.model,
+            "base_url": _base_url(llm),
+            "messages": messages,
+            "params": {"temperature": llm.temperature, **(params or {})},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, llm: LLM, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, llm.model, response, now))
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM responses WHERE rowid IN ("
+                " SELECT rowid FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Process-wide LLMResponseCache, or None when disabled with LLM_CACHE=0."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache()
+    return _llm_cache
+
+
+def _cached(llm: LLM, messages: List[dict], agent: str,
+            params: Optional[dict] = None) -> Tuple[Optional[str], Optional[str]]:
+    """(cache key, cached response); both None when the cache is off."""
+    cache = get_llm_cache()
+    if cache is None:
+        return None, None
+    key = cache.key(llm, messages, params)
+    response = cache.get(key)
+    if response is not None:
+        inc("rag_llm_cache_hits_total", agent=agent)
+    return key, response
+
+
+def _remember(key: Optional[str], llm: LLM, response: str) -> None:
+    if key is not None and response:
+        get_llm_cache().put(key, llm, response)
+
+
+# =========================
+# Direct calls
+# =========================
+
+def _prompt_tokens(messages) -> int:
+    if isinstance(messages, str):
+        return count_tokens(messages)
+    return sum(count_tokens(str(m.get("content") or "")) for m in messages)
+
+
+def _record_usage(agent: str, start: float, usage, messages, completion: str) -> None:
+    """Record the call with the API's token usage, or a tiktoken estimate when it is missing."""
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        prompt_tokens, completion_tokens = _prompt_tokens(messages), count_tokens(completion)
+    record_llm_call(agent, time.perf_counter() - start, prompt_tokens, completion_tokens)
+
+
+def chat(messages: List[dict], llm: Optional[LLM] = None, agent: str = "direct") -> str:
+    """Non-streaming completion for `messages`, traced as `agent` (which also picks the model)."""
+    llm = llm or llm_for(agent)
+    key, cached = _cached(llm, messages, agent)
+    if cached is not None:
+        return cached
+    rate_limiter.wait()
+    start = time.perf_counter()
+    response = get_openai_client(_base_url(llm)).chat.completions.create(
+        model=_api_model(llm),
+        messages=messages,
+        temperature=llm.temperature,
+    )
+    answer = response.choices[0].message.content or ""
+    _record_usage(agent, start, response.usage, messages, answer)
+    _remember(key, llm, answer)
+    return answer
+
+
+def stream_chat(messages: List[dict], llm: Optional[LLM] = None, agent: str = "direct") -> Iterator[str]:
+    """
+    Stream the completion for `messages` token by token.
+
+    Uses the OpenAI client directly (crewai's LLM.call only returns the full
+    text) with the same model and temperature as `llm`. A cached response
+    arrives as a single chunk.
+    """
+    llm = llm or llm_for(agent)
+    key, cached = _cached(llm, messages, agent)
+    if cached is not None:
+        yield cached
+        return
+    rate_limiter.wait()
+    start = time.perf_counter()
+    stream = get_openai_client(_base_url(llm)).chat.completions.create(
+        model=_api_model(llm),
+        messages=messages,
+        temperature=llm.temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts, usage = [], None
+    for chunk in stream:
+        usage = chunk.usage or usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    _record_usage(agent, start, usage, messages, "".join(parts))
+    _remember(key, llm, "".join(parts))
+
+
+async def achat(messages: List[dict], client, llm: Optional[LLM] = None, agent: str = "direct") -> str:
+    """Async, non-streaming completion for `messages` on `client`."""
+    llm = llm or llm_for(agent)
+    key, cached = await asyncio.to_thread(_cached, llm, messages, agent)
+    if cached is not None:
+        return cached
+    await rate_limiter.wait_async()
+    start = time.perf_counter()
+    response = await client.chat.completions.create(
+        model=_api_model(llm),
+        messages=messages,
+        temperature=llm.temperature,
+    )
+    answer = response.choices[0].message.content or ""
+    _record_usage(agent, start, response.usage, messages, answer)
+    await asyncio.to_thread(_remember, key, llm, answer)
+    return answer
+
+
+async def astream_chat(messages: List[dict], client, llm: Optional[LLM] = None,
+                       agent: str = "direct") -> AsyncIterator[str]:
+    """Async counterpart of stream_chat()."""
+    llm = llm or llm_for(agent)
+    key, cached = await asyncio.to_thread(_cached, llm, messages, agent)
+    if cached is not None:
+        yield cached
+        return
+    await rate_limiter.wait_async()
+    start = time.perf_counter()
+    stream = await client.chat.completions.create(
+        model=_api_model(llm),
+        messages=messages,
+        temperature=llm.temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts, usage = [], None
+    async for chunk in stream:
+        usage = chunk.usage or usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    _record_usage(agent, start, usage, messages, "".join(parts))
+    await asyncio.to_thread(_remember, key, llm, "".join(parts))
+
+
+# =========================
+# Agent LLM call tracing
+# =========================
+# crewai's agents call the LLM themselves, so their calls are picked up from
+# crewai's event bus. The bus runs handlers in the emitting thread; start
+# times and prompt sizes are kept per thread and paired with the matching
+# completion event.
+
+_call_starts: Dict[int, List[Tuple[float, int]]] = {}
+_instrumented = False
+
+
+def _event_agent(event) -> str:
+    role = getattr(event, "agent_role", None) or getattr(getattr(event, "from_agent", None), "role", None)
+    return role or "crew"
+
+
+def instrument_crewai() -> bool:
+    """Record every agent LLM call (duration and token counts); False if this crewai has no event bus."""
+    global _instrumented
+    if _instrumented:
+        return True
+    try:
+        from crewai.events import LLMCallCompletedEvent, LLMCallFailedEvent, LLMCallStartedEvent, crewai_event_bus
+    except ImportError:
+        try:
+            from crewai.utilities.events import (
+                LLMCallCompletedEvent, LLMCallFailedEvent, LLMCallStartedEvent, crewai_event_bus,
+            )
+        except ImportError:
+            logger.info("crewai event bus unavailable; agent LLM calls will not be traced")
+            return False
+
+    @crewai_event_bus.on(LLMCallStartedEvent)
+    def _on_start(source, event):
+        prompt_tokens = _prompt_tokens(getattr(event, "messages", None) or [])
+        _call_starts.setdefault(threading.get_ident(), []).append((time.perf_counter(), prompt_tokens))
+
+    @crewai_event_bus.on(LLMCallCompletedEvent)
+    def _on_complete(source, event):
+        starts = _call_starts.get(threading.get_ident())
+        start, prompt_tokens = starts.pop() if starts else (time.perf_counter(), 0)
+        record_llm_call(_event_agent(event), time.perf_counter() - start,
+                        prompt_tokens, count_tokens(str(event.response or "")))
+
+    @crewai_event_bus.on(LLMCallFailedEvent)
+    def _on_failed(source, event):
+        starts = _call_starts.get(threading.get_ident())
+        if starts:
+            starts.pop()
+
+    _instrumented = True
+    return True
+
+
+# =========================
+# Agent LLM calls
+# =========================
+# Agents call LLM.call() on answer_llm / fast_llm themselves. The method is
+# wrapped on those two instances so agent calls wait on the same rate limiter
+# and use the same response cache as direct calls. Calls that pass tools for
+# native function calling may run them, so they are never answered from the
+# cache. crewai sets stop words on the shared LLM, so they are part of the key.
+
+def _routed_call(llm: LLM, call):
+    def routed(messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        key, cached = None, None
+        if not tools and not available_functions:
+            agent = getattr(kwargs.get("from_agent"), "role", None) or "crew"
+            key, cached = _cached(llm, messages, agent, {"stop": list(getattr(llm, "stop", None) or [])})
+        if cached is not None:
+            return cached
+        rate_limiter.wait()
+        response = call(messages, tools=tools, callbacks=callbacks,
+                        available_functions=available_functions, **kwargs)
+        if isinstance(response, str):
+            _remember(key, llm, response)
+        return response
+    return routed
+
+
+def route_agent_calls(llm: LLM) -> LLM:
+    """Send `llm`'s agent calls through the rate limiter and response cache (idempotent)."""
+    if not getattr(llm.call, "_routed", False):
+        routed = _routed_call(llm, llm.call)
+        routed._routed = True
+        # Set on the instance, past any attribute validation on the LLM class
+        object.__setattr__(llm, "call", routed)
+    return llm
+
+
+route_agent_calls(answer_llm)
+route_agent_calls(fast_llm)
@@ -1,16 +1,190 @@
+import logging
+import os
+from typing import Iterator, List, Optional, Tuple
+
 from crewai import Crew
-from crew.tasks import task_gather, task_answer, DOMAIN_DIRECTIVES
+from crew.agents import VERBOSE
+from crew.cache import get_answer_cache
+from crew.llm import chat, instrument_crewai, stream_chat
+from crew.memory import (
+    Conversation, carried_documents, get_conversation_store, has_context, retrieve_for_turn, rewrite_query,
+)
+from crew.tasks import task_gather, task_answer, DOMAIN_DIRECTIVES, build_direct_messages
+from crew.tools import crew_run, format_context, retrieve_documents
+from rag.tracing import annotate, span, trace_request
+
+logger = logging.getLogger(__name__)
+
+# "direct": retrieve locally + one LLM call; "crew": the full two-agent Crew
+QUERY_MODES = ("direct", "crew")
+DEFAULT_MODE = os.getenv("QUERY_MODE", "crew")
+# Crew answers arrive in one piece, so streaming callers default to direct mode to
+# get tokens as they are generated
+STREAM_DEFAULT_MODE = os.getenv("STREAM_QUERY_MODE", "direct")
+
+instrument_crewai()
+
+def direct_messages(query: str, domain_directive: str,
+                    conversation: Optional[Conversation] = None) -> Tuple[list, List[str]]:
+    """Retrieve for `query` and build the direct RAG prompt; returns (messages, chunk IDs)."""
+    with span("retrieve"):
+        if conversation is not None:
+            docs = retrieve_for_turn(conversation, query, domain_directive)
+        else:
+            docs = retrieve_documents(query, domain_directive)
+        context = format_context(docs)
+    summary = conversation.summary if conversation is not None else ""
+    return build_direct_messages(query, domain_directive, context, summary), [d.id for d in docs if d.id]
 
-def kickoff_query(query: str, domain_directive: str):
+def run_direct(query: str, domain_directive: str) -> str:
+    """Direct RAG: retrieve the context ourselves, then answer in a single LLM call."""
+    messages, _ = direct_messages(query, domain_directive)
+    return chat(messages)
+
+def open_conversation(session_id: Optional[str], query: str) -> Tuple[Optional[Conversation], str]:
+    """Load the session's memory (if any) and rewrite a follow-up `query` into a standalone one."""
+    if not session_id:
+        return None, query
+    conversation = get_conversation_store().load(session_id)
+    return conversation, rewrite_query(conversation, query)
+
+def remember_turn(conversation: Optional[Conversation], query: str, standalone_query: str,
+                  answer: str, chunk_ids: Optional[List[str]] = None) -> None:
+    if conversation is not None:
+        get_conversation_store().record_turn(conversation, query, standalone_query, answer, chunk_ids)
+
+def run_crew(query: str, domain_directive: str, conversation: Optional[Conversation] = None,
+             chunk_ids: Optional[List[str]] = None):
+    """
+    Full pipeline: the researcher agent gathers context, the domain expert answers.
+
+    With a `conversation`, the expert also sees its summary and the previous
+    turn's chunks that are still relevant, as direct mode does. A `chunk_ids`
+    list receives the IDs of the carried chunks and of every chunk the agents' tools retrieved.
+    """
+    summary, carried = "", ""
+    carried_docs = []
+    if conversation is not None:
+        summary = conversation.summary
+        carried_docs = carried_documents(conversation, query)
+        carried = format_context(carried_docs)
     crew = Crew(
         agents=[task_gather.agent, task_answer.agent],
         tasks=[task_gather, task_answer],
-        verbose=True,
+        verbose=VERBOSE,
     )
-    return crew.kickoff(inputs={
-        "query": query,
-        "domain_directive": domain_directive,
-    })
+    annotate(mode="crew")
+    with span("crew"), crew_run(domain_directive) as run:
+        run.record(carried_docs)
+        output = crew.kickoff(inputs={
+            "query": query,
+            "domain_directive": domain_directive,
+            "conversation_summary": summary or "(none)",
+            "carried_context": carried or "(none)",
+        })
+    if chunk_ids is not None:
+        chunk_ids.extend(run.chunk_ids)
+    return output
+
+def kickoff_query(query: str, domain_directive: str, use_cache: bool = True,
+                  mode: Optional[str] = None, session_id: Optional[str] = None) -> str:
+    """
+    Answer `query` under `domain_directive` and return the answer text.
+
+    `mode` selects "direct" (one LLM call) or "crew" (two agents); it defaults
+    to $QUERY_MODE, else "crew". If the direct path fails, the full crew is used instead.
+    Near-duplicate questions already answered for the same directive, mode and
+    corpus version are served from the semantic answer cache.
+    With a `session_id`, follow-ups are rewritten into standalone questions
+    and the turn is added to the session's memory (see crew/memory.py).
+    """
+    mode = mode or DEFAULT_MODE
+    if mode not in QUERY_MODES:
+        raise ValueError(f"Unknown query mode {mode!r}; expected one of {QUERY_MODES}")
+
+    with trace_request(mode):
+        conversation, standalone = open_conversation(session_id, query)
+        cache = get_answer_cache() if use_cache else None
+        if cache is not None:
+            with span("cache_lookup"):
+                cached = cache.lookup(standalone, domain_directive, mode)
+            if cached is not None:
+                annotate(cached=True)
+                remember_turn(conversation, query, standalone, cached)
+                return cached
+
+        chunk_ids = None
+        if mode == "direct":
+            try:
+                messages, chunk_ids = direct_messages(standalone, domain_directive, conversation)
+                answer = chat(messages)
+            except Exception:
+                logger.exception("Direct RAG failed; falling back to the full crew")
+                chunk_ids = []
+                answer = str(run_crew(standalone, domain_directive, conversation, chunk_ids))
+        else:
+            chunk_ids = []
+            answer = str(run_crew(standalone, domain_directive, conversation, chunk_ids))
+
+        # An answer shaped by this session's memory must not be served to other sessions
+        if cache is not None and not has_context(conversation):
+            with span("cache_store"):
+                cache.store(standalone, domain_directive, mode, answer)
+        remember_turn(conversation, query, standalone, answer, chunk_ids)
+        return answer
+
+def stream_query(query: str, domain_directive: str, use_cache: bool = True,
+                 mode: Optional[str] = None, session_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Like kickoff_query(), but yields the answer incrementally.
+
+    In "direct" mode the answering LLM call is streamed token by token; cache
+    hits and "crew" answers arrive as a single chunk. `mode` defaults to
+    $STREAM_QUERY_MODE, else "direct". If the direct call fails before its
+    first token, the full crew answers instead.
+    """
+    mode = mode or STREAM_DEFAULT_MODE
+    if mode not in QUERY_MODES:
+        raise ValueError(f"Unknown query mode {mode!r}; expected one of {QUERY_MODES}")
+
+    with trace_request(mode):
+        conversation, standalone = open_conversation(session_id, query)
+        cache = get_answer_cache() if use_cache else None
+        if cache is not None:
+            with span("cache_lookup"):
+                cached = cache.lookup(standalone, domain_directive, mode)
+            if cached is not None:
+                annotate(cached=True)
+                remember_turn(conversation, query, standalone, cached)
+                yield cached
+                return
+
+        chunk_ids = None
+        if mode == "direct":
+            parts = []
+            try:
+                messages, chunk_ids = direct_messages(standalone, domain_directive, conversation)
+                for token in stream_chat(messages):
+                    parts.append(token)
+                    yield token
+                answer = "".join(parts)
+            except Exception:
+                if parts:
+                    raise
+                logger.exception("Direct RAG failed; falling back to the full crew")
+                chunk_ids = []
+                answer = str(run_crew(standalone, domain_directive, conversation, chunk_ids))
+                yield answer
+        else:
+            chunk_ids = []
+            answer = str(run_crew(standalone, domain_directive, conversation, chunk_ids))
+            yield answer
+
+        # An answer shaped by this session's memory must not be served to other sessions
+        if cache is not None and not has_context(conversation):
+            with span("cache_store"):
+                cache.store(standalone, domain_directive, mode, answer)
+        remember_turn(conversation, query, standalone, answer, chunk_ids)
 
 if __name__ == "__main__":
     q = "What specific policy levers does the strategy propose to improve Canada's AI compute infrastructure?"
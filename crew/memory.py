@@ -0,0 +1,363 @@
+# crew/memory.py
+"""
+Multi-turn conversation memory.
+
+Each chat session keeps:
+
+- a rolling summary of the conversation, updated after every turn and held
+  under `summary_tokens` tokens, so prompts never replay the full history
+- the standalone form of the last question and a truncated copy of its answer,
+  used to rewrite follow-ups ("what about its funding?") into standalone queries
+- the chunk IDs retrieved for the last turn; those still relevant to the next
+  query are carried into its context alongside the fresh hits
+
+Sessions live in a SQLite file in data/, so they survive app restarts. The
+summary update runs on a background thread pool after the answer is
+delivered; updates of one session are chained so they apply in order, while
+different sessions summarise in parallel. Loading a session waits for its
+pending updates.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from crew.llm import chat
+from crew.tasks import build_rewrite_messages, build_summary_messages
+from crew.tools import retrieve_documents
+from rag.retriever import DATA_DIR, get_collection, get_embeddings
+from rag.tokens import truncate_to_tokens
+from rag.tracing import span
+
+logger = logging.getLogger(__name__)
+
+MEMORY_PATH = os.path.join(DATA_DIR, "conversations.sqlite3")
+
+SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "300"))
+# How much of the previous answer the rewriter and the summariser see
+ANSWER_EXCERPT_TOKENS = 400
+# Carried-over chunks must be at least this similar to the new query
+REUSE_THRESHOLD = float(os.getenv("CONVERSATION_REUSE_THRESHOLD", "0.45"))
+MAX_REUSED_CHUNKS = int(os.getenv("CONVERSATION_MAX_REUSED", "4"))
+# Turns kept for redisplay in the UI (the LLM only ever sees the summary)
+MAX_STORED_TURNS = 50
+SUMMARY_WAIT_SECONDS = 30.0
+SUMMARY_WORKERS = int(os.getenv("CONVERSATION_SUMMARY_WORKERS", "4"))
+
+# Messages that lean on earlier turns are rewritten before retrieval: ones that
+# open with a connective or a pronoun, short ones with a pronoun, and ones
+# with no content words of their own ("why?", "tell me more")
+_LEADING_REFERENCE = re.compile(
+    r"^(and|but|so|also|then|what about|how about|why not|elaborate|expand|explain more|tell me more"
+    r"|it|its|they|them|their|this|that|these|those|there|the (?:same|above|former|latter))\b",
+    re.IGNORECASE,
+)
+_PRONOUN = re.compile(r"\b(it|its|they|them|their|these|those|the (?:same|above|former|latter))\b", re.IGNORECASE)
+_SHORT_FOLLOW_UP_WORDS = 6
+_FILLER_WORDS = set("""
+a an the and or but so of for to in on at by with about from is are was were be do does did can could
+should would will what which who whom why how when where more details detail please explain elaborate
+expand tell give go say mean further me you us again else other another example examples some any
+it its this that they them
+""".split())
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+@dataclass
+class Conversation:
+    """What is remembered about one chat session."""
+
+    session_id: str
+    summary: str = ""
+    last_question: str = ""
+    last_answer: str = ""
+    chunk_ids: List[str] = field(default_factory=list)
+    turns: int = 0
+
+
+class ConversationStore:
+    """SQLite-backed conversation sessions."""
+
+    def __init__(self, path: str = MEMORY_PATH, summary_tokens: int = SUMMARY_TOKENS):
+        self.summary_tokens = summary_tokens
+        self._lock = threading.Lock()
+        # Latest queued summary update per session; guarded by _pending_lock
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._summarizer = ThreadPoolExecutor(max_workers=max(1, SUMMARY_WORKERS),
+                                              thread_name_prefix="conversation-summary")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id    TEXT PRIMARY KEY,
+                summary       TEXT NOT NULL,
+                last_question TEXT NOT NULL,
+                last_answer   TEXT NOT NULL,
+                chunk_ids     TEXT NOT NULL,
+                turns         INTEGER NOT NULL,
+                updated_at    REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id       TEXT NOT NULL,
+                turn             INTEGER NOT NULL,
+                question         TEXT NOT NULL,
+                answer           TEXT NOT NULL,
+                created_at       REAL NOT NULL,
+                standalone_query TEXT,
+                PRIMARY KEY (session_id, turn)
+            );
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(turns)")}
+        if "standalone_query" not in columns:  # stores created before the column existed
+            self._db.execute("ALTER TABLE turns ADD COLUMN standalone_query TEXT")
+        self._db.commit()
+
+    # ---------- public API ----------
+
+    def load(self, session_id: str) -> Conversation:
+        """The session's memory (empty for a new session), after any pending summary update."""
+        with self._pending_lock:
+            pending = self._pending.get(session_id)
+        if pending is not None:
+            try:
+                pending.result(timeout=SUMMARY_WAIT_SECONDS)
+            except TimeoutError:
+                logger.warning("Conversation summary still updating; using the previous summary")
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary, last_question, last_answer, chunk_ids, turns FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return Conversation(session_id)
+        summary, last_question, last_answer, chunk_ids, turns = row
+        return Conversation(session_id, summary, last_question, last_answer, json.loads(chunk_ids), turns)
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        """Stored turns as chat messages ({"role", "content"}), oldest first, for redisplay."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT question, answer FROM turns WHERE session_id = ? ORDER BY turn",
+                (session_id,),
+            ).fetchall()
+        messages = []
+        for question, answer in rows:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def questions(self) -> List[str]:
+        """
+        Every stored question in its standalone form, across all sessions (used
+        to rank frequent questions). Turns stored before standalone queries were
+        recorded fall back to the raw question.
+        """
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT COALESCE(standalone_query, question) FROM turns")]
+
+    def record_turn(self, conversation: Conversation, question: str, standalone_query: str,
+                    answer: str, chunk_ids: Optional[List[str]] = None) -> None:
+        """
+        Save one turn; the summary is folded in on a background thread.
+
+        `chunk_ids=None` (e.g. an answer-cache hit) keeps the previous turn's chunks.
+        """
+        now = time.time()
+        conversation.turns += 1
+        conversation.last_question = standalone_query
+        conversation.last_answer = truncate_to_tokens(answer, ANSWER_EXCERPT_TOKENS)
+        if chunk_ids is not None:
+            conversation.chunk_ids = list(chunk_ids)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO turns (session_id, turn, question, answer, created_at, standalone_query)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation.session_id, conversation.turns, question, answer, now, standalone_query),
+            )
+            self._db.execute(
+                "DELETE FROM turns WHERE session_id = ? AND turn <= ?",
+                (conversation.session_id, conversation.turns - MAX_STORED_TURNS),
+            )
+            self._save(conversation, now)
+        self._schedule_summary(conversation)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+    # ---------- internals ----------
+
+    def _save(self, conversation: Conversation, now: float) -> None:
+        # The summary column belongs to _update_summary(): `conversation` may have been loaded
+        # before a pending update finished (load() timed out), and must not overwrite it
+        self._db.execute(
+            "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(session_id) DO UPDATE SET last_question = excluded.last_question,"
+            " last_answer = excluded.last_answer, chunk_ids = excluded.chunk_ids,"
+            " turns = excluded.turns, updated_at = excluded.updated_at",
+            (conversation.session_id, conversation.summary, conversation.last_question,
+             conversation.last_answer, json.dumps(conversation.chunk_ids), conversation.turns, now),
+        )
+        self._db.commit()
+
+    def _schedule_summary(self, conversation: Conversation) -> None:
+        """Queue a summary update that starts once the session's previous one has finished."""
+        session_id = conversation.session_id
+        future: Future = Future()
+        with self._pending_lock:
+            previous = self._pending.get(session_id)
+            self._pending[session_id] = future
+
+        def finish(done: Future) -> None:
+            with self._pending_lock:
+                if self._pending.get(session_id) is future:
+                    del self._pending[session_id]
+            error = done.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+        def start(_=None) -> None:
+            try:
+                self._summarizer.submit(self._update_summary, conversation).add_done_callback(finish)
+            except RuntimeError as e:  # executor shut down at interpreter exit
+                with self._pending_lock:
+                    if self._pending.get(session_id) is future:
+                        del self._pending[session_id]
+                future.set_exception(e)
+
+        if previous is None:
+            start()
+        else:
+            previous.add_done_callback(start)
+
+    def _update_summary(self, conversation: Conversation) -> None:
+        # Chained per session by _schedule_summary(), so updates of one session apply in order
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary FROM sessions WHERE session_id = ?", (conversation.session_id,)
+            ).fetchone()
+        summary = row[0] if row else conversation.summary
+        messages = build_summary_messages(
+            summary, conversation.last_question, conversation.last_answer,
+            max_words=int(self.summary_tokens * 0.75),
+        )
+        try:
+            with span("summarize"):
+                updated = chat(messages, agent="summarize").strip()
+        except Exception:
+            logger.exception("Conversation summary update failed; keeping the previous summary")
+            return
+        # The model is asked for a word limit; the token budget is enforced here
+        updated = truncate_to_tokens(updated, self.summary_tokens)
+        with self._lock:
+            self._db.execute(
+                "UPDATE sessions SET summary = ?, updated_at = ? WHERE session_id = ?",
+                (updated, time.time(), conversation.session_id),
+            )
+            self._db.commit()
+        conversation.summary = updated
+
+
+def has_context(conversation: Optional[Conversation]) -> bool:
+    """Whether answers in this session are shaped by its summary or carried-over chunks."""
+    return conversation is not None and bool(conversation.summary or conversation.chunk_ids)
+
+
+def is_follow_up(message: str) -> bool:
+    """Whether `message` probably depends on earlier turns (see _LEADING_REFERENCE)."""
+    text = message.strip()
+    if _LEADING_REFERENCE.match(text):
+        return True
+    words = re.findall(r"[A-Za-z0-9][\w'-]*", text)
+    if len(words) <= _SHORT_FOLLOW_UP_WORDS and _PRONOUN.search(text):
+        return True
+    return not any(word.lower() not in _FILLER_WORDS for word in words)
+
+
+def needs_rewrite(conversation: Conversation, message: str) -> bool:
+    """Whether `message` should be rewritten before retrieval (follow-ups only)."""
+    return conversation.turns > 0 and is_follow_up(message)
+
+
+def rewrite_query(conversation: Conversation, message: str) -> str:
+    """Standalone form of a follow-up `message`; other messages are returned unchanged."""
+    if not needs_rewrite(conversation, message):
+        return message
+    messages = build_rewrite_messages(
+        message, conversation.summary, conversation.last_question, conversation.last_answer
+    )
+    try:
+        with span("rewrite"):
+            rewritten = chat(messages, agent="rewrite").strip().strip('"')
+    except Exception:
+        logger.exception("Query rewrite failed; retrieving with the raw message")
+        return message
+    return rewritten or message
+
+
+def carried_documents(conversation: Conversation, query: str, exclude: Sequence[str] = ()) -> List[Document]:
+    """The previous turn's chunks (other than `exclude`) that are still relevant to `query`."""
+    carried = [cid for cid in conversation.chunk_ids if cid not in set(exclude)]
+    if not carried:
+        return []
+
+    with span("reuse_chunks"):
+        vector = np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+        found = get_collection().get(ids=carried, include=["documents", "metadatas", "embeddings"])
+        if not found["ids"]:
+            return []
+        scores = np.asarray(found["embeddings"], dtype=np.float32) @ vector
+        order = [i for i in np.argsort(-scores) if scores[i] >= REUSE_THRESHOLD][:MAX_REUSED_CHUNKS]
+    reused = [
+        Document(page_content=found["documents"][i] or "", metadata=found["metadatas"][i] or {},
+                 id=found["ids"][i])
+        for i in order
+    ]
+    if reused:
+        logger.info(f"Reusing {len(reused)} chunk(s) from the previous turn")
+    return reused
+
+
+def retrieve_for_turn(conversation: Conversation, query: str,
+                      domain_directive: Optional[str] = None) -> List[Document]:
+    """Fresh top-k documents plus the previous turn's chunks that are still relevant to `query`."""
+    docs = retrieve_documents(query, domain_directive)
+    return docs + carried_documents(conversation, query, [d.id for d in docs])
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Process-wide ConversationStore."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore()
+    return _store
@@ -0,0 +1,233 @@
+# crew/precompute.py
+"""
+Precomputed answers for the starter questions and the most frequent queries.
+
+An offline job answers, for every DOMAIN_DIRECTIVES key, the curated
+STARTER_QUESTIONS plus the questions users ask most often (counted from the
+conversation store, optionally extended with a text file of questions). The
+answers are stored in data/precomputed.sqlite3 together with the corpus
+version they were built from. The Streamlit starter buttons and every
+QueryService request (after any follow-up rewrite, before the answer cache)
+serve them with a single exact-key lookup (no embedding, retrieval or LLM
+call), and entries built from an older corpus are ignored until the job
+regenerates them, which `python -m rag.ingest` does after every change to the
+corpus.
+
+Usage:
+    python -m crew.precompute                  # regenerate missing and stale entries
+    python -m crew.precompute --top 20 --questions extra_questions.txt
+    python -m crew.precompute --force          # regenerate everything
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from crew.cache import normalize_query
+from crew.memory import get_conversation_store, is_follow_up
+from crew.service import QueryService
+from crew.tasks import DOMAIN_DIRECTIVES
+from rag.retriever import DATA_DIR, corpus_version
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTED_PATH = os.path.join(DATA_DIR, "precomputed.sqlite3")
+
+# The starter buttons in frontend/app.py
+STARTER_QUESTIONS = [
+    "What is Canada’s Position Relative to Global AI Leaders?",
+    "What determines national AI competitiveness?",
+    "Outline the implementation roadmap phases from 0 to 60+ months.",
+]
+
+# How many of the most frequently asked questions are precomputed per domain
+TOP_QUESTIONS = int(os.getenv("PRECOMPUTE_TOP_QUESTIONS", "10"))
+
+
+@dataclass
+class PrecomputedAnswer:
+    question: str
+    answer: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+class PrecomputedStore:
+    """SQLite table of answers keyed by (domain, normalized question), tagged with the corpus version."""
+
+    def __init__(self, path: str = PRECOMPUTED_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                domain         TEXT NOT NULL,
+                query_key      TEXT NOT NULL,
+                question       TEXT NOT NULL,
+                corpus_version TEXT NOT NULL,
+                answer         TEXT NOT NULL,
+                chunk_ids      TEXT NOT NULL,
+                created_at     REAL NOT NULL,
+                PRIMARY KEY (domain, query_key)
+            )
+            """
+        )
+        self._db.commit()
+
+    def get(self, domain: str, question: str) -> Optional[PrecomputedAnswer]:
+        """The answer precomputed for the current corpus version, else None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT question, answer, chunk_ids FROM answers"
+                " WHERE domain = ? AND query_key = ? AND corpus_version = ?",
+                (domain, normalize_query(question), corpus_version()),
+            ).fetchone()
+        if row is None:
+            return None
+        return PrecomputedAnswer(row[0], row[1], json.loads(row[2]))
+
+    def put(self, domain: str, question: str, answer: str, chunk_ids: Sequence[str], version: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (domain, normalize_query(question), question, version, answer,
+                 json.dumps(list(chunk_ids)), time.time()),
+            )
+            self._db.commit()
+
+    def is_fresh(self, domain: str, question: str, version: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM answers WHERE domain = ? AND query_key = ? AND corpus_version = ?",
+                (domain, normalize_query(question), version),
+            ).fetchone()
+        return row is not None
+
+    def prune(self, version: str) -> int:
+        """Delete entries built from other corpus versions; returns how many were removed."""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM answers WHERE corpus_version != ?", (version,)).rowcount
+            self._db.commit()
+        return removed
+
+
+_store: Optional[PrecomputedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_precomputed_store() -> PrecomputedStore:
+    """Process-wide PrecomputedStore."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PrecomputedStore()
+    return _store
+
+
+def find_precomputed(question: str, domain_directive: str) -> Optional[PrecomputedAnswer]:
+    """The current precomputed answer to `question` under the directive text `domain_directive`, else None."""
+    for domain, directive in DOMAIN_DIRECTIVES.items():
+        if directive == domain_directive:
+            return get_precomputed_store().get(domain, question)
+    return None
+
+
+def frequent_questions(limit: int, extra_path: Optional[str] = None) -> List[str]:
+    """
+    The `limit` most frequently asked questions (near-identical wording merged).
+
+    Counts the standalone form of every question in the conversation store
+    (skipping any follow-up that was not rewritten, which only makes sense
+    within its conversation) plus, optionally, one question per line of
+    `extra_path`.
+    """
+    asked = [q for q in get_conversation_store().questions() if not is_follow_up(q)]
+    if extra_path:
+        with open(extra_path, "r", encoding="utf-8") as f:
+            asked.extend(line.strip() for line in f if line.strip())
+    counts: Counter = Counter()
+    wording: Dict[str, str] = {}
+    for question in asked:
+        key = normalize_query(question)
+        counts[key] += 1
+        wording.setdefault(key, question)
+    return [wording[key] for key, _ in counts.most_common(limit)]
+
+
+async def precompute(
+    domains: Sequence[str] = tuple(DOMAIN_DIRECTIVES),
+    top: int = TOP_QUESTIONS,
+    extra_path: Optional[str] = None,
+    parallelism: int = 4,
+    mode: Optional[str] = None,
+    force: bool = False,
+) -> Dict[str, int]:
+    """Answer every missing or stale (domain, question) pair and store it under the current corpus version."""
+    store = get_precomputed_store()
+    version = corpus_version()
+    unique: Dict[str, str] = {}
+    for question in STARTER_QUESTIONS + frequent_questions(top, extra_path):
+        unique.setdefault(normalize_query(question), question)
+    questions = list(unique.values())
+    todo = [
+        (domain, question)
+        for domain in domains
+        for question in questions
+        if force or not store.is_fresh(domain, question, version)
+    ]
+    counts = {"ok": 0, "failed": 0, "fresh": len(domains) * len(questions) - len(todo)}
+    logger.info(f"Corpus {version}: {len(todo)} answer(s) to precompute, {counts['fresh']} up to date")
+
+    # The answer cache is bypassed so that every entry is generated from the current corpus
+    service = QueryService(max_concurrency=parallelism, max_queued=len(todo) + 1, queue_timeout=None)
+
+    async def one(domain: str, question: str) -> None:
+        try:
+            result = await service.run(question, DOMAIN_DIRECTIVES[domain], mode=mode, use_cache=False)
+        except Exception as e:
+            logger.warning(f"[{domain}] {question!r} failed: {e}")
+            counts["failed"] += 1
+            return
+        store.put(domain, question, result.answer, result.chunk_ids, version)
+        counts["ok"] += 1
+
+    try:
+        await asyncio.gather(*(one(domain, question) for domain, question in todo))
+    finally:
+        await service.aclose()
+
+    removed = store.prune(version)
+    logger.info(f"Precompute finished: {counts}, {removed} stale entr{'y' if removed == 1 else 'ies'} removed")
+    return counts
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute answers for starter and frequent questions")
+    parser.add_argument("--domain", action="append", choices=sorted(DOMAIN_DIRECTIVES),
+                        help="domain(s) to precompute (default: all)")
+    parser.add_argument("--top", type=int, default=TOP_QUESTIONS, help="most frequent questions to include")
+    parser.add_argument("--questions", default=None, help="extra questions, one per line, counted as asked once")
+    parser.add_argument("--parallelism", type=int, default=4, help="queries executed concurrently")
+    parser.add_argument("--mode", choices=["direct", "crew"], default=None, help="default: $QUERY_MODE")
+    parser.add_argument("--force", action="store_true", help="regenerate entries that are still fresh")
+    args = parser.parse_args()
+    asyncio.run(precompute(
+        domains=args.domain or tuple(DOMAIN_DIRECTIVES),
+        top=args.top,
+        extra_path=args.questions,
+        parallelism=args.parallelism,
+        mode=args.mode,
+        force=args.force,
+    ))
@@ -0,0 +1,72 @@
+# crew/routing.py
+"""
+Route a query to the part of the corpus that can answer it.
+
+Ingest records structured metadata on every chunk (`source_type`: report,
+tables or references; `element_type`: text, list or table; `section`;
+`page`), so retrieval can search a scoped subset instead of the whole
+collection. Routes are plain Chroma `where` filters:
+
+- questions about sources and citations search the References PDF
+- roadmap/phase/recommendation questions search the Report
+- numeric questions (amounts, shares, rankings, ...) search the Tables PDF
+- other questions under the "policy" answer focus search the Report
+
+Anything else searches everything. Set RAG_ROUTING=0 to disable routing.
+crew/tools.py searches the routed subset and only falls back to the whole
+corpus when the subset returns fewer than k chunks.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Optional
+
+ROUTING_ENABLED = os.getenv("RAG_ROUTING", "1") != "0"
+
+REFERENCES = {"source_type": "references"}
+NUMERIC = {"source_type": "tables"}
+REPORT = {"source_type": "report"}
+
+_REFERENCE_QUERY = re.compile(
+    r"\b(references?|citations?|cited?|bibliograph\w*|sources? (?:for|of|behind)|who (?:wrote|published))\b",
+    re.IGNORECASE,
+)
+_NUMERIC_QUERY = re.compile(
+    r"\b(how (?:many|much)|percent(?:age)?|share of|number of|rank(?:s|ed|ing)?|statistics?|figures?"
+    r"|billion|million|budget|spend(?:ing)?|growth rate|tables?)\b|[$%]",
+    re.IGNORECASE,
+)
+_REPORT_QUERY = re.compile(
+    r"\b(roadmap|phases?|timeline|milestones?|pillars?|recommendations?|implementation)\b",
+    re.IGNORECASE,
+)
+
+# Answer focuses whose questions are answered from the Report narrative
+_REPORT_DOMAINS = {"policy"}
+
+
+def _domain_of(domain_directive: Optional[str]) -> Optional[str]:
+    # crew.tasks imports the agents, which import the tools that import this module
+    from crew.tasks import DOMAIN_DIRECTIVES
+    for domain, directive in DOMAIN_DIRECTIVES.items():
+        if directive == domain_directive:
+            return domain
+    return None
+
+
+def route_filter(query: str, domain_directive: Optional[str] = None) -> Optional[dict]:
+    """Chroma `where` filter for `query`, or None to search the whole corpus."""
+    if not ROUTING_ENABLED:
+        return None
+    if _REFERENCE_QUERY.search(query):
+        return REFERENCES
+    if _REPORT_QUERY.search(query):
+        return REPORT
+    if _NUMERIC_QUERY.search(query):
+        return NUMERIC
+    if domain_directive and _domain_of(domain_directive) in _REPORT_DOMAINS:
+        return REPORT
+    return None
+
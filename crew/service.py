@@ -0,0 +1,514 @@
+# crew/service.py
+"""
+Asyncio query service around crew.main.
+
+- one pooled AsyncOpenAI client shared by every request
+- a semaphore caps how many queries execute at once; the rest wait in line
+  (bounded by `max_queued` and `queue_timeout`) and are rejected with
+  ServiceBusy when the line is full or the wait runs out
+- every execution has a hard `request_timeout` and is cancelled when all of
+  its callers go away; crew runs (synchronous, so they cannot be interrupted)
+  use a dedicated thread pool, and one that outlives its request keeps its
+  slot until the thread finishes
+- precomputed answers (crew/precompute.py) are served before the answer cache
+- identical concurrent questions share one execution (in-flight dedup), keyed
+  on the standalone question after any follow-up rewrite, so callers from
+  different sessions share it too; a shared stream fans its tokens out to
+  every caller
+- with a `session_id`, follow-ups are rewritten using the session's memory
+  (the rewrite call holds an execution slot and is bounded by
+  `request_timeout`) and each turn is remembered (see crew/memory.py)
+
+Async callers (the HTTP API) use QueryService directly; synchronous callers
+(the Streamlit app) go through get_query_service(), which runs a QueryService
+on a private event-loop thread.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from crew.cache import get_answer_cache, normalize_query
+from crew.llm import achat, astream_chat, make_async_client
+from crew.main import DEFAULT_MODE, QUERY_MODES, STREAM_DEFAULT_MODE, direct_messages, remember_turn, run_crew
+from crew.memory import Conversation, get_conversation_store, has_context, needs_rewrite, rewrite_query
+from rag.tracing import annotate, detached_trace, record_span, span, trace_request, use_trace
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = int(os.getenv("QUERY_MAX_CONCURRENCY", "8"))
+MAX_QUEUED = int(os.getenv("QUERY_MAX_QUEUED", "64"))
+QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", "30"))
+REQUEST_TIMEOUT = float(os.getenv("QUERY_REQUEST_TIMEOUT", "120"))
+
+
+class ServiceBusy(RuntimeError):
+    """Raised when a query cannot be admitted (queue full or queue wait timed out)."""
+
+
+@dataclass
+class QueryResult:
+    """Answer plus the retrieved chunk IDs and per-stage timings (seconds)."""
+
+    answer: str
+    mode: str
+    cached: bool = False
+    # The question actually answered (a follow-up rewritten into a standalone query)
+    standalone_query: Optional[str] = None
+    chunk_ids: List[str] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+@contextlib.contextmanager
+def _timed(result: QueryResult, stage: str, traced: bool = True):
+    """Add the stage's duration to `result.timings` (and, if `traced`, to the request trace)."""
+    start = time.perf_counter()
+    try:
+        with span(stage) if traced else contextlib.nullcontext():
+            yield
+    finally:
+        result.timings[stage] = result.timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _find_precomputed(query: str, domain_directive: str):
+    # crew.precompute drives a QueryService itself, so it is imported on first use
+    from crew.precompute import find_precomputed
+    return find_precomputed(query, domain_directive)
+
+
+class _Slot:
+    """An execution slot; see QueryService._admitted()."""
+
+    def __init__(self):
+        # The slot's worker thread (a crew run or a rewrite); if still running when the request ends,
+        # it keeps the slot
+        self.thread: Optional[Future] = None
+
+
+class _Flight:
+    """
+    One shared execution: its task, the callers still following it, and (for
+    streams) the tokens produced so far plus one queue per subscriber.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.tokens: List[str] = []
+        self.subscribers: List[asyncio.Queue] = []
+
+    def publish(self, token: str) -> None:
+        self.tokens.append(token)
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(token)
+
+    def subscribe(self) -> asyncio.Queue:
+        """A queue replaying the tokens so far, then every new one, then None at the end."""
+        subscriber: asyncio.Queue = asyncio.Queue()
+        for token in self.tokens:
+            subscriber.put_nowait(token)
+        if self.task.done():
+            subscriber.put_nowait(None)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def close(self, _task=None) -> None:
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(None)
+
+
+class QueryService:
+    """Bounded-concurrency, deduplicating async front for kickoff_query-style requests."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_queued: int = MAX_QUEUED,
+        queue_timeout: Optional[float] = QUEUE_TIMEOUT,
+        request_timeout: float = REQUEST_TIMEOUT,
+    ):
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queued = 0
+        self._abandoned = 0
+        # Crew runs and rewrites; only a slot holder submits work, so this pool never queues
+        self._crew_pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="crew-run")
+        self._inflight: Dict[Tuple, _Flight] = {}
+        self._client = make_async_client()
+
+    # ---------- public API ----------
+
+    async def run(self, query: str, domain_directive: str, mode: Optional[str] = None,
+                  use_cache: bool = True, session_id: Optional[str] = None) -> QueryResult:
+        """Answer `query` with details; identical concurrent questions share one execution."""
+        mode = self._check_mode(mode)
+        with trace_request(mode):
+            result = QueryResult(answer="", mode=mode)
+            started = time.perf_counter()
+            with _timed(result, "memory"):
+                conversation, standalone = await self._open_conversation(session_id, query)
+            result.standalone_query = standalone
+            if not await self._stored_answer(standalone, domain_directive, mode, use_cache, result):
+                key = ("run",) + self._flight_key(standalone, domain_directive, mode, use_cache, conversation)
+                flight = self._flight(key, lambda flight: self._answer_shared(
+                    standalone, domain_directive, mode, use_cache, conversation))
+                flight.waiters += 1
+                try:
+                    shared = await asyncio.shield(flight.task)
+                except asyncio.CancelledError:
+                    if flight.waiters == 1 and not flight.task.done():
+                        flight.task.cancel()  # last caller gave up; stop the shared execution
+                    raise
+                finally:
+                    flight.waiters -= 1
+                result.answer, result.mode, result.chunk_ids = shared.answer, shared.mode, list(shared.chunk_ids)
+                for stage, seconds in shared.timings.items():
+                    result.timings[stage] = result.timings.get(stage, 0.0) + seconds
+
+            await asyncio.to_thread(remember_turn, conversation, query, standalone, result.answer,
+                                    result.chunk_ids or None)
+            result.timings["total"] = time.perf_counter() - started
+            return result
+
+    async def answer(self, query: str, domain_directive: str, mode: Optional[str] = None,
+                     use_cache: bool = True, session_id: Optional[str] = None) -> str:
+        """Same contract as kickoff_query(): just the answer text."""
+        return (await self.run(query, domain_directive, mode, use_cache, session_id)).answer
+
+    async def stream(self, query: str, domain_directive: str, mode: Optional[str] = None,
+                     use_cache: bool = True, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yield the answer incrementally (token stream in "direct" mode).
+
+        `mode` defaults to STREAM_DEFAULT_MODE ("direct"), the only mode that
+        streams tokens. Identical concurrent questions share one producer; a caller that joins
+        late first receives the tokens already streamed.
+        """
+        mode = self._check_mode(mode or STREAM_DEFAULT_MODE)
+        # The trace is current only around each step, never across a yield: this generator
+        # runs in its consumer's context, which would otherwise keep the trace between tokens
+        with detached_trace(mode) as trace:
+            with use_trace(trace):
+                conversation, standalone = await self._open_conversation(session_id, query)
+                result = QueryResult(answer="", mode=mode, standalone_query=standalone)
+                stored = await self._stored_answer(standalone, domain_directive, mode, use_cache, result)
+                if stored:
+                    await asyncio.to_thread(remember_turn, conversation, query, standalone, result.answer,
+                                            result.chunk_ids or None)
+            if stored:
+                yield result.answer
+                return
+
+            with use_trace(trace):  # the shared producer task inherits the trace
+                key = ("stream",) + self._flight_key(standalone, domain_directive, mode, use_cache, conversation)
+                flight = self._flight(key, lambda flight: self._stream_shared(
+                    flight, standalone, domain_directive, mode, use_cache, conversation))
+            tokens = flight.subscribe()
+            flight.waiters += 1
+            try:
+                while True:
+                    token = await tokens.get()
+                    if token is None:
+                        break
+                    yield token
+                shared = await flight.task  # already finished; re-raises its error
+            finally:
+                flight.waiters -= 1
+                flight.subscribers.remove(tokens)
+                if flight.waiters == 0 and not flight.task.done():
+                    flight.task.cancel()  # last caller gave up; stop the shared execution
+            with use_trace(trace):
+                await asyncio.to_thread(remember_turn, conversation, query, standalone, shared.answer,
+                                        shared.chunk_ids or None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queued, "in_flight": len(self._inflight), "abandoned_runs": self._abandoned}
+
+    async def aclose(self) -> None:
+        await self._client.close()
+        self._crew_pool.shutdown(wait=False)
+
+    # ---------- internals ----------
+
+    @staticmethod
+    def _check_mode(mode: Optional[str]) -> str:
+        mode = mode or DEFAULT_MODE
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode {mode!r}; expected one of {QUERY_MODES}")
+        return mode
+
+    @contextlib.asynccontextmanager
+    async def _admitted(self):
+        """
+        Wait in line for an execution slot, or raise ServiceBusy.
+
+        Yields a _Slot. If the slot's worker thread is still running when the
+        block exits (timeout or cancellation), the slot is released only once
+        that thread finishes, so abandoned runs count against the limit.
+        """
+        if self._queued >= self.max_queued:
+            raise ServiceBusy(f"{self._queued} queries already waiting")
+        self._queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ServiceBusy(f"Waited {self.queue_timeout:.0f}s for a free slot") from None
+        finally:
+            self._queued -= 1
+        slot = _Slot()
+        try:
+            yield slot
+        finally:
+            if slot.thread is not None and not slot.thread.done():
+                logger.warning("Worker thread outlived its request; keeping its slot until it finishes")
+                self._abandoned += 1
+                loop = asyncio.get_running_loop()
+                slot.thread.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release_abandoned))
+            else:
+                self._semaphore.release()
+
+    def _release_abandoned(self) -> None:
+        self._abandoned -= 1
+        self._semaphore.release()
+
+    async def _open_conversation(self, session_id: Optional[str],
+                                 query: str) -> Tuple[Optional[Conversation], str]:
+        """Load the session's memory and rewrite a follow-up `query` inside an execution slot."""
+        if not session_id:
+            return None, query
+        conversation = await asyncio.to_thread(get_conversation_store().load, session_id)
+        if not needs_rewrite(conversation, query):
+            return conversation, query
+        async with self._admitted() as slot:
+            # Like a crew run, a rewrite that times out keeps its slot until its thread finishes
+            slot.thread = self._crew_pool.submit(contextvars.copy_context().run, rewrite_query, conversation, query)
+            try:
+                standalone = await asyncio.wait_for(asyncio.wrap_future(slot.thread), timeout=self.request_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Query rewrite timed out; retrieving with the raw message")
+                standalone = query
+        return conversation, standalone
+
+    @staticmethod
+    def _flight_key(standalone: str, domain_directive: str, mode: str, use_cache: bool,
+                    conversation: Optional[Conversation]) -> Tuple:
+        """What one shared execution's answer depends on: the standalone question, not the session."""
+        context = None
+        if has_context(conversation):
+            # The summary and carried-over chunks also go into the prompt
+            context = (conversation.summary, tuple(conversation.chunk_ids))
+        return normalize_query(standalone), domain_directive, mode, use_cache, context
+
+    def _flight(self, key: Tuple, start) -> _Flight:
+        """The in-flight execution for `key`, started as `start(flight)` if there is none."""
+        flight = self._inflight.get(key)
+        if flight is not None:
+            logger.info("Joining in-flight execution for an identical query")
+            return flight
+        flight = self._inflight[key] = _Flight()
+        flight.task = asyncio.ensure_future(start(flight))
+        flight.task.add_done_callback(flight.close)
+        flight.task.add_done_callback(
+            lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is flight else None
+        )
+        return flight
+
+    async def _stored_answer(self, standalone: str, domain_directive: str, mode: str, use_cache: bool,
+                             result: QueryResult) -> bool:
+        """Fill `result` from the precomputed answers or the answer cache; False if neither has one."""
+        if not use_cache:
+            return False
+        with _timed(result, "precomputed_lookup"):
+            precomputed = await asyncio.to_thread(_find_precomputed, standalone, domain_directive)
+        if precomputed is not None:
+            annotate(cached=True, precomputed=True)
+            result.answer, result.cached, result.chunk_ids = precomputed.answer, True, list(precomputed.chunk_ids)
+            return True
+        cache = get_answer_cache()
+        if cache is None:
+            return False
+        with _timed(result, "cache_lookup"):
+            cached = await asyncio.to_thread(cache.lookup, standalone, domain_directive, mode)
+        if cached is None:
+            return False
+        annotate(cached=True)
+        result.answer, result.cached = cached, True
+        return True
+
+    async def _store_answer(self, standalone: str, domain_directive: str, mode: str, use_cache: bool,
+                            result: QueryResult, conversation: Optional[Conversation]) -> None:
+        # An answer shaped by one session's memory must not be served to other sessions
+        cache = get_answer_cache() if use_cache and not has_context(conversation) else None
+        if cache is not None:
+            with _timed(result, "cache_store"):
+                await asyncio.to_thread(cache.store, standalone, domain_directive, mode, result.answer)
+
+    async def _answer_shared(self, standalone: str, domain_directive: str, mode: str, use_cache: bool,
+                             conversation: Optional[Conversation]) -> QueryResult:
+        """The execution behind run(): wait for a slot, answer, and cache the answer."""
+        result = QueryResult(answer="", mode=mode, standalone_query=standalone)
+        queued_at = time.perf_counter()
+        async with self._admitted() as slot:
+            result.timings["queue_wait"] = time.perf_counter() - queued_at
+            record_span("queue_wait", result.timings["queue_wait"])
+            await asyncio.wait_for(self._execute(standalone, domain_directive, result, conversation, slot),
+                                   timeout=self.request_timeout)
+        await self._store_answer(standalone, domain_directive, mode, use_cache, result, conversation)
+        return result
+
+    async def _stream_shared(self, flight: _Flight, standalone: str, domain_directive: str, mode: str,
+                             use_cache: bool, conversation: Optional[Conversation]) -> QueryResult:
+        """The producer behind stream(): publishes every token to the flight's subscribers."""
+        result = QueryResult(answer="", mode=mode, standalone_query=standalone)
+        queued_at = time.perf_counter()
+        async with self._admitted() as slot:
+            record_span("queue_wait", time.perf_counter() - queued_at)
+            if mode == "direct":
+                try:
+                    async for token in self._stream_direct(standalone, domain_directive, result, conversation):
+                        flight.publish(token)
+                except (asyncio.CancelledError, asyncio.TimeoutError):
+                    raise
+                except Exception:
+                    if flight.tokens:
+                        raise
+                    logger.exception("Direct RAG failed; falling back to the full crew")
+                    result.mode = "crew"
+                    await asyncio.wait_for(self._execute(standalone, domain_directive, result, conversation, slot),
+                                           timeout=self.request_timeout)
+                    flight.publish(result.answer)
+            else:
+                await asyncio.wait_for(self._execute(standalone, domain_directive, result, conversation, slot),
+                                       timeout=self.request_timeout)
+                flight.publish(result.answer)
+        result.answer = "".join(flight.tokens)
+        await self._store_answer(standalone, domain_directive, mode, use_cache, result, conversation)
+        return result
+
+    async def _stream_direct(self, query: str, domain_directive: str, result: QueryResult,
+                             conversation: Optional[Conversation] = None) -> AsyncIterator[str]:
+        """Token stream of the direct RAG answer, bounded by `request_timeout` overall."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout
+        messages, result.chunk_ids = await asyncio.wait_for(
+            asyncio.to_thread(direct_messages, query, domain_directive, conversation),
+            timeout=self.request_timeout,
+        )
+        tokens = astream_chat(messages, self._client)
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(tokens.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    return
+                yield token
+        finally:
+            await tokens.aclose()
+
+    async def _execute(self, query: str, domain_directive: str, result: QueryResult,
+                       conversation: Optional[Conversation] = None, slot: Optional[_Slot] = None) -> None:
+        """Fill `result` with the answer, the IDs of the chunks behind it, and stage timings."""
+        if result.mode == "direct":
+            try:
+                with _timed(result, "retrieve", traced=False):  # direct_messages() traces retrieval
+                    messages, result.chunk_ids = await asyncio.to_thread(
+                        direct_messages, query, domain_directive, conversation
+                    )
+                with _timed(result, "llm", traced=False):  # achat() traces the call itself
+                    result.answer = await achat(messages, self._client)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Direct RAG failed; falling back to the full crew")
+                result.mode = "crew"
+                result.chunk_ids = []
+        # crewai is synchronous; a timeout abandons the worker thread, which keeps `slot` until it ends
+        chunk_ids: List[str] = []
+        thread = self._crew_pool.submit(contextvars.copy_context().run, run_crew, query, domain_directive,
+                                        conversation, chunk_ids)
+        if slot is not None:
+            slot.thread = thread
+        with _timed(result, "crew", traced=False):  # run_crew() records its own span
+            result.answer = str(await asyncio.wrap_future(thread))
+        result.chunk_ids = chunk_ids
+
+
+# =========================
+# Synchronous bridge
+# =========================
+
+class BackgroundQueryService:
+    """Runs a QueryService on a private event-loop thread for synchronous callers."""
+
+    def __init__(self, **service_kwargs):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="query-service", daemon=True)
+        self._thread.start()
+        self.service = asyncio.run_coroutine_threadsafe(self._create(service_kwargs), self.loop).result()
+
+    @staticmethod
+    async def _create(service_kwargs) -> QueryService:
+        return QueryService(**service_kwargs)
+
+    def run(self, query: str, domain_directive: str, **kwargs) -> QueryResult:
+        future = asyncio.run_coroutine_threadsafe(self.service.run(query, domain_directive, **kwargs), self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def answer(self, query: str, domain_directive: str, **kwargs) -> str:
+        return self.run(query, domain_directive, **kwargs).answer
+
+    def stream(self, query: str, domain_directive: str, **kwargs) -> Iterator[str]:
+        """Blocking iterator over QueryService.stream(); closing it cancels the query."""
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for token in self.service.stream(query, domain_directive, **kwargs):
+                    items.put(("token", token))
+                items.put(("done", None))
+            except BaseException as e:
+                items.put(("error", e))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "token":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+
+_background: Optional[BackgroundQueryService] = None
+_background_lock = threading.Lock()
+
+
+def get_query_service() -> BackgroundQueryService:
+    """Process-wide QueryService for synchronous code such as the Streamlit app."""
+    global _background
+    if _background is None:
+        with _background_lock:
+            if _background is None:
+                _background = BackgroundQueryService()
+    return _background
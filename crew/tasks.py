@@ -24,6 +24,14 @@ DOMAIN_DIRECTIVES = {
     "manufacturing": "Emphasize AI adoption in real sectors (energy, health) and productivity gains.",
 }
 
+
+def get_directive(domain: str) -> str:
+    """Directive text for a DOMAIN_DIRECTIVES key (as used by the batch runner and HTTP API)."""
+    try:
+        return DOMAIN_DIRECTIVES[domain]
+    except KeyError:
+        raise ValueError(f"Unknown domain {domain!r}; expected one of {sorted(DOMAIN_DIRECTIVES)}") from None
+
 # =========================
 # Task 1: Retrieval
 # =========================
@@ -81,33 +89,46 @@ task_gather = Task(
 # Task 2: Answer
 # =========================
 
+ANSWER_STYLE = (
+    "STYLE:\n"
+    "- Answer naturally, like ChatGPT: clear, friendly, and easy to read.\n"
+    "- Use 2–5 paragraphs unless the question asks for phases, steps, pillars, or timelines.\n"
+    "- If the question includes words like 'outline', 'phases', 'roadmap', '0–60 months', "
+    "'steps', or 'pillars', you SHOULD use a clean numbered list.\n"
+    "- Each numbered item should have 1–3 sentences. Start with a short intro paragraph, "
+    "then the list, then one small closing paragraph.\n"
+    "- Do NOT use visible section labels like 'Explanation', 'Evidence', or 'Implications'. "
+    "Blend these elements into normal paragraphs.\n\n"
+)
+
+ANSWER_BODY_RULES = (
+    "In the body of the answer:\n"
+    "- Give a clear answer in normal prose.\n"
+    "- Refer to supporting evidence or numbers from the retrieved context.\n"
+    "- Briefly note what it means for national AI strategy or the relevant country. "
+    "If no country is mentioned, discuss the global implications.\n"
+    "- If the question is about phases, pillars, steps, or a roadmap, present the items as a numbered list.\n\n"
+    "END the entire response with ONE bold summary sentence (≤25 words).\n"
+    "If the user does NOT mention a specific country, answer in general global terms and "
+    "do NOT default to Canada. Use Canada only as an example if clearly helpful.\n"
+    "If the user explicitly mentions Canada or the Maple Protocol, then you may focus on Canada.\n"
+    "If something is not in the context, say you don't know."
+)
+
 task_answer = Task(
     description=(
         SYSTEM_RULES
-        + "\n\nSTYLE:\n"
-        "- Answer naturally, like ChatGPT: clear, friendly, and easy to read.\n"
-        "- Use 2–5 paragraphs unless the question asks for phases, steps, pillars, or timelines.\n"
-        "- If the question includes words like 'outline', 'phases', 'roadmap', '0–60 months', "
-        "'steps', or 'pillars', you SHOULD use a clean numbered list.\n"
-        "- Each numbered item should have 1–3 sentences. Start with a short intro paragraph, "
-        "then the list, then one small closing paragraph.\n"
-        "- Do NOT use visible section labels like 'Explanation', 'Evidence', or 'Implications'. "
-        "Blend these elements into normal paragraphs.\n\n"
-        "DIRECTIVE:\n"
+        + "\n\n" + ANSWER_STYLE
+        + "DIRECTIVE:\n"
         "{domain_directive}\n\n"
+        "CONVERSATION SO FAR (summary, for reference only; it is not evidence):\n"
+        "{conversation_summary}\n\n"
+        "CONTEXT CARRIED OVER FROM THE PREVIOUS TURN:\n"
+        "{carried_context}\n\n"
         "INSTRUCTION:\n"
-        "Use the Policy Researcher's retrieved context to answer the question using only information "
-        "that appears in the context or background facts. In the body of the answer:\n"
-        "- Give a clear answer in normal prose.\n"
-        "- Refer to supporting evidence or numbers from the retrieved context.\n"
-        "- Briefly note what it means for national AI strategy or the relevant country. "
-        "If no country is mentioned, discuss the global implications.\n"
-        "- If the question is about phases, pillars, steps, or a roadmap, present the items as a numbered list.\n\n"
-        "END the entire response with ONE bold summary sentence (≤25 words).\n"
-        "If the user does NOT mention a specific country, answer in general global terms and "
-        "do NOT default to Canada. Use Canada only as an example if clearly helpful.\n"
-        "If the user explicitly mentions Canada or the Maple Protocol, then you may focus on Canada.\n"
-        "If something is not in the context, say you don't know."
+        "Use the Policy Researcher's retrieved context and any carried-over context to answer the question "
+        "using only information that appears in the context or background facts. "
+        + ANSWER_BODY_RULES
     ),
     expected_output=(
         "A natural answer (paragraphs plus a numbered list when appropriate) that covers explanation, "
@@ -116,3 +137,88 @@ task_answer = Task(
     agent=domain_expert,
     context=[task_gather],
 )
+
+# =========================
+# Direct RAG prompt (single LLM call, no agents)
+# =========================
+
+DIRECT_SYSTEM_PROMPT = (
+    SYSTEM_RULES
+    + "\n\n" + ANSWER_STYLE
+    + "DIRECTIVE:\n"
+    "{domain_directive}\n\n"
+    "INSTRUCTION:\n"
+    "Use the retrieved context from the Maple Protocol report supplied by the user message to answer "
+    "the question using only information that appears in the context or background facts. "
+    + ANSWER_BODY_RULES
+)
+
+DIRECT_USER_PROMPT = (
+    "RETRIEVED CONTEXT:\n"
+    "{context}\n\n"
+    "QUESTION:\n"
+    "{query}"
+)
+
+# Prepended to DIRECT_USER_PROMPT for follow-up questions in a conversation
+DIRECT_CONVERSATION_PROMPT = (
+    "CONVERSATION SO FAR (summary, for reference only; it is not evidence):\n"
+    "{summary}\n\n"
+)
+
+
+def build_direct_messages(query: str, domain_directive: str, context: str, conversation: str = "") -> list:
+    """Chat messages for answering `query` in one LLM call from pre-retrieved context."""
+    user_prompt = DIRECT_USER_PROMPT.format(
+        context=context or "(no relevant context was retrieved)",
+        query=query,
+    )
+    if conversation:
+        user_prompt = DIRECT_CONVERSATION_PROMPT.format(summary=conversation) + user_prompt
+    return [
+        {"role": "system", "content": DIRECT_SYSTEM_PROMPT.format(domain_directive=domain_directive)},
+        {"role": "user", "content": user_prompt},
+    ]
+
+# =========================
+# Conversation memory prompts (see crew/memory.py)
+# =========================
+
+REWRITE_PROMPT = (
+    "Rewrite the user's latest message as a single standalone search question about the Maple Protocol "
+    "report, resolving pronouns and references using the conversation. Keep the user's wording where "
+    "possible. If the message is already standalone, return it unchanged. "
+    "Reply with the question only."
+)
+
+SUMMARY_PROMPT = (
+    "You maintain a compact running summary of a conversation about the Maple Protocol report. "
+    "Update the summary with the new exchange. Keep the topics, entities, numbers and conclusions "
+    "needed to understand follow-up questions; drop wording and pleasantries. "
+    "Use at most {max_words} words. Reply with the summary only."
+)
+
+
+def build_rewrite_messages(message: str, summary: str, last_question: str, last_answer: str) -> list:
+    """Chat messages that turn a follow-up `message` into a standalone question."""
+    return [
+        {"role": "system", "content": REWRITE_PROMPT},
+        {"role": "user", "content": (
+            f"CONVERSATION SUMMARY:\n{summary or '(none)'}\n\n"
+            f"PREVIOUS QUESTION:\n{last_question}\n\n"
+            f"PREVIOUS ANSWER:\n{last_answer}\n\n"
+            f"LATEST MESSAGE:\n{message}"
+        )},
+    ]
+
+
+def build_summary_messages(summary: str, question: str, answer: str, max_words: int) -> list:
+    """Chat messages that fold one question/answer exchange into the running summary."""
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT.format(max_words=max_words)},
+        {"role": "user", "content": (
+            f"CURRENT SUMMARY:\n{summary or '(empty)'}\n\n"
+            f"NEW QUESTION:\n{question}\n\n"
+            f"NEW ANSWER:\n{answer}"
+        )},
+    ]
@@ -1,32 +1,104 @@
 # crew/tools.py
 
 from __future__ import annotations
-from typing import List
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
 import re
 
 from crewai.tools import tool
 from langchain_core.documents import Document
+from crew.routing import route_filter
+from rag.packing import PACK_ENABLED, pack_context
+from rag.rerank import RERANK_CANDIDATES, RERANK_ENABLED, rerank
 from rag.retriever import get_retriever
+from rag.tracing import span
 
-_retriever = get_retriever(k=5)
+RETRIEVAL_K = 5
 
-def _retrieve_docs(query: str) -> List[Document]:
+def _search(query: str, k: int, where: Optional[dict]) -> List[Document]:
+    """Top-k documents from the routed subset, topped up from the whole corpus only if it runs short."""
+    # The shared retriever loads lazily on first use, not at import time
+    docs = get_retriever(k=k, filter=where).invoke(query)
+    if where and len(docs) < k:
+        seen = {d.id for d in docs}
+        docs += [d for d in get_retriever(k=k).invoke(query) if d.id not in seen][:k - len(docs)]
+    return docs
+
+def _retrieve_docs(query: str, domain_directive: Optional[str] = None) -> List[Document]:
     """Return top-k retrieved documents using modern LCEL API."""
-    return _retriever.invoke(query)
+    where = route_filter(query, domain_directive)
+    if RERANK_ENABLED:
+        # Over-fetch, then let the cross-encoder keep what fits the token budget
+        candidates = _search(query, RERANK_CANDIDATES, where)
+        with span("rerank"):
+            return rerank(query, candidates)
+    return _search(query, RETRIEVAL_K, where)
+
+def retrieve_documents(query: str, domain_directive: Optional[str] = None) -> List[Document]:
+    """Public access to the top-k documents behind `retrieve_context` (routed by query and directive)."""
+    return _retrieve_docs(query, domain_directive)
+
+def format_context(docs: List[Document]) -> str:
+    """Turn retrieved chunks into one context string (merged, de-duplicated and token-budgeted)."""
+    if PACK_ENABLED:
+        with span("pack_context"):
+            return pack_context(docs).text
+    return "\n\n".join((d.page_content or "").strip() for d in docs if d.page_content)
+
+def get_context(query: str, domain_directive: Optional[str] = None) -> str:
+    """Plain (non-tool) retrieval: the context string `retrieve_context` returns for `query`."""
+    return format_context(_retrieve_docs(query, domain_directive))
+
+@dataclass
+class CrewRun:
+    """
+    What the agent tools know about the crew run calling them (the LLM only
+    passes a query), and the IDs of the chunks they retrieved for it.
+    """
+    domain_directive: Optional[str] = None
+    chunk_ids: List[str] = field(default_factory=list)
+
+    def record(self, docs: List[Document]) -> None:
+        for d in docs:
+            if d.id and d.id not in self.chunk_ids:
+                self.chunk_ids.append(d.id)
+
+_crew_run: ContextVar[Optional[CrewRun]] = ContextVar("crew_run", default=None)
+
+@contextmanager
+def crew_run(domain_directive: str) -> Iterator[CrewRun]:
+    """Scope for one crew kickoff: the agent tools route their retrieval by `domain_directive`."""
+    run = CrewRun(domain_directive)
+    token = _crew_run.set(run)
+    try:
+        yield run
+    finally:
+        _crew_run.reset(token)
+
+def _run_docs(query: str) -> List[Document]:
+    """Retrieval for an agent tool, routed by and recorded on the current crew run."""
+    run = _crew_run.get()
+    docs = _retrieve_docs(query, run.domain_directive if run is not None else None)
+    if run is not None:
+        run.record(docs)
+    return docs
 
 @tool("retrieve_context")
 def retrieve_context(query: str) -> str:
     """Given a user query, return one concatenated string of the top-k retrieved news chunks."""
-    docs = _retrieve_docs(query)
-    return "\n\n".join((d.page_content or "").strip() for d in docs if d.page_content)
+    return format_context(_run_docs(query))
 
 @tool("retrieve_citations")
 def retrieve_citations(query: str) -> str:
     """Given a user query, return bulleted cited snippets with [title](link)."""
-    docs = _retrieve_docs(query)
+    docs = _run_docs(query)
     lines = []
     for d in docs:
         title = d.metadata.get("title", "") or d.metadata.get("source", "")
+        if d.metadata.get("page"):
+            title += f", p. {d.metadata['page']}"
         link  = d.metadata.get("link", "")
         snippet = (d.page_content or "").strip()
         if len(snippet) > 600:
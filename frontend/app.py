@@ -17,8 +17,17 @@ if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
 import streamlit as st
-from crew.main import kickoff_query                     # expects: kickoff_query(query: str, domain_directive: str)
+from crew.main import STREAM_DEFAULT_MODE
+from crew.memory import get_conversation_store, new_session_id
+from crew.precompute import STARTER_QUESTIONS
+from crew.service import get_query_service              # shared async service: .stream(query, domain_directive, mode=...)
 from crew.tasks import DOMAIN_DIRECTIVES                # dict of domain -> directive text
+from rag.retriever import warm_up
+
+
+# Load the shared embedding model + vectorstore in the background (once per process)
+if os.getenv("RAG_WARM_UP", "1") != "0":
+    warm_up()
 
 
 # Page config
@@ -124,14 +133,32 @@ with st.sidebar:
         # label_visibility="visible"  # default; we can just omit this line
     )
 
+    use_full_crew = st.checkbox(
+        "Use full agent crew (slower)",
+        value=(STREAM_DEFAULT_MODE == "crew"),
+        help="Unticked, answers come from one retrieval + one LLM call and stream as they are written. "
+             "Tick this to run the two-agent researcher/expert crew instead; its answer appears all at once.",
+    )
+    query_mode = "crew" if use_full_crew else "direct"
+
     if st.button("Clear chat", use_container_width=True):
+        # Start a new conversation; the old one stays in the session store
+        st.session_state.session_id = new_session_id()
+        st.query_params["session"] = st.session_state.session_id
         st.session_state.history = []
 
 
 # Chat state
+if "session_id" not in st.session_state:
+    # The session ID lives in the URL, so a reload or an app restart resumes the conversation
+    st.session_state.session_id = st.query_params.get("session") or new_session_id()
+    st.query_params["session"] = st.session_state.session_id
 if "history" not in st.session_state:
     # list[dict]: {"role": "user"|"assistant", "content": str}
-    st.session_state.history = []
+    st.session_state.history = get_conversation_store().history(st.session_state.session_id)
+if "pending_question" not in st.session_state:
+    # question whose answer still has to be streamed on this run
+    st.session_state.pending_question = None
 
 
 #  Chat input
@@ -139,15 +166,7 @@ prompt = st.chat_input("Ask about Canada’s AI strategy and competitiveness..."
 if prompt:
     # Show user message immediately
     st.session_state.history.append({"role": "user", "content": prompt})
-
-    directive = DOMAIN_DIRECTIVES[selected_domain]
-    with st.spinner("Thinking..."):
-        try:
-            answer = kickoff_query(query=prompt, domain_directive=directive)
-        except Exception as e:
-            answer = f"Sorry, something went wrong: `{e}`"
-
-    st.session_state.history.append({"role": "assistant", "content": str(answer)})
+    st.session_state.pending_question = prompt
 
 
 
@@ -167,27 +186,40 @@ for msg in st.session_state.history:
         st.markdown(msg["content"])
 
 
+# Stream the answer to the pending question into a new chat bubble
+if st.session_state.pending_question:
+    question = st.session_state.pending_question
+    st.session_state.pending_question = None
+
+    directive = DOMAIN_DIRECTIVES[selected_domain]
+    with st.chat_message("assistant", avatar=chatbot_icon_path):
+        try:
+            answer = st.write_stream(
+                get_query_service().stream(
+                    query=question,
+                    domain_directive=directive,
+                    mode=query_mode,
+                    session_id=st.session_state.session_id,
+                )
+            )
+        except Exception as e:
+            answer = f"Sorry, something went wrong: `{e}`"
+            st.markdown(answer)
+
+    st.session_state.history.append({"role": "assistant", "content": str(answer)})
+
+
 # Quick starter questions
 st.divider()
 st.caption("Quick Maple Protocol questions:")
 cols = st.columns(3)
 
-examples = [
-    "What is Canada’s Position Relative to Global AI Leaders?",
-    "What determines national AI competitiveness?",
-    "Outline the implementation roadmap phases from 0 to 60+ months.",
-]
+examples = STARTER_QUESTIONS
 
 for i, ex in enumerate(examples):
     if cols[i % 3].button(ex, use_container_width=True):
         st.session_state.history.append({"role": "user", "content": ex})
-
-        directive = DOMAIN_DIRECTIVES[selected_domain]
-        with st.spinner("Thinking..."):
-            try:
-                answer = kickoff_query(query=ex, domain_directive=directive)
-            except Exception as e:
-                answer = f"Sorry, something went wrong: `{e}`"
-
-        st.session_state.history.append({"role": "assistant", "content": str(answer)})
+        # Asked like a typed question: the query service serves the answer precomputed by
+        # `python -m crew.precompute` and records the turn without blocking this script
+        st.session_state.pending_question = ex
         st.rerun()
@@ -0,0 +1,114 @@
+# rag/bm25.py
+"""
+Compact in-process BM25 inverted index over the ingested chunks.
+
+Dense retrieval (mpnet + Chroma) tends to miss exact terms such as program
+names, dollar figures and acronyms; BM25 catches them. The index is built by
+rag/ingest.py from the same chunks that go into Chroma and persisted as JSON
+inside the vectorstore directory; rag/retriever.py fuses both rankings with
+reciprocal rank fusion.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+INDEX_FILENAME = "bm25_index.json"
+
+# Keeps numbers like "2.4" or "1,000" and hyphenated names together
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,'\-][a-z0-9]+)*")
+
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word/number tokens without stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunk IDs."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}  # term -> [(doc index, term frequency)]
+        self._avgdl = 0.0
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Iterable[str], **params) -> "BM25Index":
+        index = cls(**params)
+        for doc, (cid, text) in enumerate(zip(ids, texts)):
+            tokens = tokenize(text or "")
+            index.ids.append(cid)
+            index.doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                index.postings.setdefault(term, []).append((doc, tf))
+        index._finalize()
+        return index
+
+    def _finalize(self) -> None:
+        self._avgdl = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Top-k (chunk ID, score) pairs for `query`."""
+        n = len(self.ids)
+        if not n:
+            return []
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc] / self._avgdl)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[doc], score) for doc, score in top]
+
+    # ---------- persistence ----------
+
+    def save(self, path: str) -> None:
+        """Write the index atomically as compact JSON."""
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_lens": self.doc_lens,
+            "postings": self.postings,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.ids = payload["ids"]
+        index.doc_lens = payload["doc_lens"]
+        index.postings = {term: [tuple(p) for p in plist] for term, plist in payload["postings"].items()}
+        index._finalize()
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], rrf_k: int = 60) -> List[str]:
+    """Fuse several ranked ID lists: score(id) = sum over lists of 1 / (rrf_k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=lambda cid: scores[cid], reverse=True)
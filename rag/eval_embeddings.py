@@ -0,0 +1,128 @@
+# rag/eval_embeddings.py
+"""
+Compare an embedding backend against a reference backend on held-out queries.
+
+Every backend runs in its own subprocess (so peak memory is measured
+separately), embeds all chunks currently in the vectorstore plus the queries,
+and does an exact top-k search. Reported per candidate backend:
+
+- recall@k: overlap of its top-k chunk IDs with the reference backend's top-k
+- query encode latency (p50 / mean, milliseconds) and peak RSS
+
+Usage:
+    python -m rag.eval_embeddings --backend onnx --backend int8 --k 5
+    python -m rag.eval_embeddings --backend int8 --queries held_out.txt --threads 4
+"""
+
+import argparse
+import json
+import logging
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from rag.embeddings import EMBED_BACKENDS, load_sentence_model
+from rag.retriever import DEFAULT_MODEL, PROJECT_ROOT, get_collection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = [
+    "What is Canada's position relative to global AI leaders?",
+    "What determines national AI competitiveness?",
+    "Outline the implementation roadmap phases from 0 to 60+ months.",
+    "What policy levers improve sovereign AI compute capacity?",
+    "How large is the AI talent brain drain from Canada?",
+    "Why do Canadian AI startups struggle to scale up?",
+    "How much venture capital flows into AI companies?",
+    "Which sectors such as energy and health benefit from AI adoption?",
+    "What funding does the Pan-Canadian AI Strategy provide?",
+    "What risks does the strategy identify for AI regulation?",
+]
+
+
+def load_queries(path: str) -> List[str]:
+    """One query per line, or JSONL records with a "query" field."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return queries
+
+
+def run_backend(backend: str, model_name: str, queries: List[str], k: int, threads: int) -> Dict:
+    """Embed corpus + queries with one backend and return its top-k IDs and timings."""
+    import numpy as np
+
+    model = load_sentence_model(model_name, backend=backend, threads=threads)
+    stored = get_collection().get(include=["documents"])
+    ids = stored["ids"]
+    corpus = model.encode([d or "" for d in stored["documents"]], normalize_embeddings=True, batch_size=32)
+
+    encode_ms, top_ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        vector = model.encode([query], normalize_embeddings=True)[0]
+        encode_ms.append((time.perf_counter() - start) * 1000)
+        scores = corpus @ vector
+        top = np.argsort(-scores)[:k]
+        top_ids.append([ids[i] for i in top])
+
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {"top_ids": top_ids, "encode_ms": encode_ms, "peak_rss_mb": peak_mb}
+
+
+def recall_at_k(reference: List[List[str]], candidate: List[List[str]]) -> float:
+    per_query = [len(set(r) & set(c)) / len(r) for r, c in zip(reference, candidate) if r]
+    return sum(per_query) / len(per_query) if per_query else 0.0
+
+
+def _run_in_subprocess(backend: str, args) -> Dict:
+    command = [sys.executable, "-m", "rag.eval_embeddings", "--worker", backend,
+               "--model", args.model, "--k", str(args.k), "--threads", str(args.threads)]
+    if args.queries:
+        command += ["--queries", args.queries]
+    output = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="recall@k and latency of embedding backends")
+    parser.add_argument("--backend", action="append", choices=EMBED_BACKENDS,
+                        help="candidate backend (repeatable; default: onnx and int8)")
+    parser.add_argument("--reference", default="torch", choices=EMBED_BACKENDS)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--queries", default=None, help="held-out queries (text lines or JSONL)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="encoder threads (0 = library default)")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries) if args.queries else DEFAULT_QUERIES
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.model, queries, args.k, args.threads)))
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    reference = _run_in_subprocess(args.reference, args)
+    rows = [(args.reference, reference, 1.0)]
+    for backend in args.backend or ["onnx", "int8"]:
+        result = _run_in_subprocess(backend, args)
+        rows.append((backend, result, recall_at_k(reference["top_ids"], result["top_ids"])))
+
+    print(f"\n{len(queries)} queries, k={args.k}, reference={args.reference}")
+    print(f"{'backend':<8} {'recall@k':>9} {'p50 ms':>8} {'mean ms':>8} {'peak RSS MB':>12}")
+    for backend, result, recall in rows:
+        print(f"{backend:<8} {recall:>9.3f} {statistics.median(result['encode_ms']):>8.1f} "
+              f"{statistics.mean(result['encode_ms']):>8.1f} {result['peak_rss_mb']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+# rag/eval_retrieval.py
+"""
+Offline retrieval quality-vs-speed evaluation over chunking, embedding model and k.
+
+The PDFs in data/ are parsed once (in a process pool). Then every
+(chunking strategy, embedding model) pair is built into its own temporary
+index in a pool of worker processes: the same NumPy matrix + BM25 files that
+rag/ingest.py writes. Once every build has finished, the indexes are queried
+one at a time in the main process, the way rag/retriever.py searches (exact
+dense top-k, fused with BM25 unless --dense-only), so query latency is not
+measured under contention. The live vectorstore is never touched.
+
+Chunking strategies ("name:size:overlap"):
+
+- fixed:     the whole PDF as one text, split by character count (ignores structure)
+- sections:  Unstructured elements grouped under their heading, one block per
+             table, then split (what rag/ingest.py does)
+- elements:  one chunk per PDF element (paragraph, list item, table, title);
+             only elements longer than `size` are split
+
+Relevance labels are evidence strings rather than chunk IDs, so one labelled
+set scores every chunking: a retrieved chunk covers an evidence string if it
+contains it (case, whitespace and typographic quotes/dashes are ignored).
+Reported per (strategy, model, k):
+
+- recall@k: share of each question's evidence strings found in its top k
+- MRR@k: reciprocal rank of the first chunk that covers any evidence
+- context tokens: tiktoken tokens in the top k chunks (the prompt they cost)
+- chunk count, index size on disk, build time (chunk + embed + write) and
+  query latency (encode + search, p50 / p95)
+
+Usage:
+    python -m rag.eval_retrieval
+    python -m rag.eval_retrieval --strategy sections:600:100 --strategy elements:800 --k 3 --k 5 --k 8
+    python -m rag.eval_retrieval --model all-mpnet-base-v2 --model all-MiniLM-L6-v2 --workers 2
+    python -m rag.eval_retrieval --questions labelled.jsonl --out eval.json
+
+Labelled questions are JSONL records: {"query": "...", "evidence": ["...", ...]}.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_community.vectorstores.utils import filter_complex_metadata
+from langchain_core.documents import Document
+
+from rag.bm25 import INDEX_FILENAME as BM25_INDEX_FILENAME, BM25Index, reciprocal_rank_fusion
+from rag.embeddings import EMBED_BACKEND, load_sentence_model
+from rag.ingest import (
+    CHUNK_OVERLAP, CHUNK_SIZE, DATA_DIR, SKIPPED_CATEGORIES, chunk_ids, group_elements, load_pdf,
+    source_type, split_documents,
+)
+from rag.npindex import NumpyIndex, export_index
+from rag.retriever import DEFAULT_MODEL
+from rag.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+CHUNKING_STRATEGIES = ("fixed", "sections", "elements")
+DEFAULT_STRATEGIES = [
+    f"fixed:{CHUNK_SIZE}:{CHUNK_OVERLAP}",
+    f"sections:{CHUNK_SIZE}:{CHUNK_OVERLAP}",
+    "sections:600:100",
+    "sections:1500:200",
+    f"elements:{CHUNK_SIZE}",
+]
+DEFAULT_KS = [3, 5, 8]
+# What production uses today: ingest's chunking, the default model, and crew/tools.py's k
+BASELINE = (f"sections:{CHUNK_SIZE}:{CHUNK_OVERLAP}", DEFAULT_MODEL, 5)
+# Dense and BM25 candidates fused per query (CachedRetriever.fetch_k)
+FETCH_K = 20
+
+DEFAULT_QUESTIONS = [
+    {"query": "What is Canada's position relative to global AI leaders?",
+     "evidence": ["strong policy intent and adequate infrastructure",
+                  "2.1 standard deviations below the top three average"]},
+    {"query": "What determines national AI competitiveness?",
+     "evidence": ["compute infrastructure is the dominant driver", "research strength is the next tier of drivers"]},
+    {"query": "Outline the implementation roadmap phases from 0 to 60+ months.",
+     "evidence": ["Innovation & Model Development Expansion", "System-Wide Adoption & Public-Sector Modernization",
+                  "Ecosystem Scaling & Global Competitiveness"]},
+    {"query": "How much private AI investment does the strategy aim for?",
+     "evidence": ["$2.9B to $9B"]},
+    {"query": "How many AI-capable data centres does Canada have compared with the US and China?",
+     "evidence": ["compared with 26 in the US"]},
+    {"query": "How does the strategy stop the brain drain of AI talent?",
+     "evidence": ["Compute-for-Retention", "AI Talent Visa"]},
+    {"query": "Which AI indexes were used as data sources?",
+     "evidence": ["Notable AI indices used include"]},
+    {"query": "Why did Canada fall in the Tortoise Media ranking?",
+     "evidence": ["dropped from 4th place to 8th", "18th in Infrastructure"]},
+    {"query": "What are the risks of grid capacity and permitting delays for data centres?",
+     "evidence": ["Permitting processes in Canada can take"]},
+    {"query": "How will the environmental impact of new GPU capacity be mitigated?",
+     "evidence": ["Mandate heat-reuse systems"]},
+    {"query": "What are the targets of the National AI Literacy & Trust Mission?",
+     "evidence": ["AI literacy rank from ~27"]},
+    {"query": "How is the strategy funded without new spending?",
+     "evidence": ["No spending deficit is required", "planned federal savings"]},
+    {"query": "What will the Canadian Foundation Model Program deliver?",
+     "evidence": ["Fund 5 large-scale Canadian foundation models", "from 61 to 150 by 2030"]},
+    {"query": "How do the UK and France differ in regulating AI?",
+     "evidence": ["hybrid approach, combining a sector-specific", "high-regulation, rights-based model"]},
+    {"query": "What are the limitations of the correlation analysis?",
+     "evidence": ["133 out of 193 entries missing", "Correlation, not causation"]},
+    {"query": "Which features correlate most strongly with AI readiness?",
+     "evidence": ["Total_AI_Datacenters", "highest Spearman correlation"]},
+    {"query": "Which source is cited for the countries with the most data centers?",
+     "evidence": ["The Top 25 Countries With the Most Data Centers"]},
+    {"query": "What immediate actions should the government take to start Phase 1?",
+     "evidence": ["Recommended Immediate Actions", "Secure Infrastructure Sites"]},
+]
+
+_TYPOGRAPHY = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"',
+                             "‐": "-", "‑": "-", "–": "-", "—": "-"})
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case, straight quotes and hyphens, single spaces."""
+    return re.sub(r"\s+", " ", (text or "").translate(_TYPOGRAPHY).lower()).strip()
+
+
+def load_questions(path: str) -> List[Dict]:
+    """JSONL records with "query" and a non-empty "evidence" list."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if not record.get("evidence"):
+                raise ValueError(f"Question without evidence strings: {record.get('query')!r}")
+            questions.append(record)
+    return questions
+
+
+def parse_strategy(spec: str) -> Tuple[str, int, int]:
+    """Split "name:size:overlap" (e.g. "sections:1000:400"); size and overlap default to ingest's."""
+    name, *numbers = spec.split(":")
+    if name not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy {name!r}; expected one of {CHUNKING_STRATEGIES}")
+    size = int(numbers[0]) if numbers else CHUNK_SIZE
+    overlap = int(numbers[1]) if len(numbers) > 1 else (0 if name == "elements" else CHUNK_OVERLAP)
+    return name, size, overlap
+
+
+# =========================
+# Chunking
+# =========================
+
+def chunk_pdf(elements: List, pdf_path: Path, spec: str) -> List[Document]:
+    """Chunk one parsed PDF with the strategy `spec`."""
+    name, size, overlap = parse_strategy(spec)
+    kept = [e for e in elements
+            if (e.page_content or "").strip() and e.metadata.get("category", "") not in SKIPPED_CATEGORIES]
+    if name == "sections":
+        return filter_complex_metadata(split_documents(group_elements(elements, pdf_path), size, overlap))
+
+    metadata = {"source": str(pdf_path), "source_type": source_type(pdf_path)}
+    if name == "fixed":
+        text = "\n\n".join(e.page_content.strip() for e in kept)
+        return split_documents([Document(page_content=text, metadata=metadata)], size, overlap)
+    blocks = [
+        Document(page_content=e.page_content.strip(),
+                 metadata={**metadata, "page": e.metadata.get("page_number"),
+                           "category": e.metadata.get("category", "")})
+        for e in kept
+    ]
+    return filter_complex_metadata(split_documents(blocks, size, overlap))
+
+
+# =========================
+# Build (worker) and score (main process) one (strategy, model) index
+# =========================
+
+def _directory_bytes(directory: str) -> int:
+    return sum(path.stat().st_size for path in Path(directory).rglob("*") if path.is_file())
+
+
+def build_config(spec: str, model_name: str, parsed: List[Tuple[str, List]], directory: str,
+                 threads: int = 0) -> Dict:
+    """Chunk, embed and write the index for (`spec`, `model_name`) into `directory`."""
+    model = load_sentence_model(model_name, backend=EMBED_BACKEND, threads=threads)
+
+    start = time.perf_counter()
+    chunks, ids = [], []
+    for pdf_path, elements in parsed:
+        file_chunks = chunk_pdf(elements, Path(pdf_path), spec)
+        chunks.extend(file_chunks)
+        ids.extend(chunk_ids(file_chunks, Path(pdf_path).name))
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = model.encode(texts, normalize_embeddings=True, batch_size=32)
+    export_index(directory, ids, vectors, texts, [chunk.metadata for chunk in chunks])
+    BM25Index.build(ids, texts).save(os.path.join(directory, BM25_INDEX_FILENAME))
+    build_seconds = time.perf_counter() - start
+
+    return {
+        "strategy": spec,
+        "model": model_name,
+        "ids": ids,
+        "texts": texts,
+        "index_mb": _directory_bytes(directory) / (1024 * 1024),
+        "build_seconds": build_seconds,
+    }
+
+
+def score_config(build: Dict, directory: str, model, questions: List[Dict], ks: Sequence[int],
+                 hybrid: bool = True) -> Dict:
+    """Time every question against a built index and score it at every k."""
+    ids, texts = build["ids"], build["texts"]
+    index = NumpyIndex(directory)
+    bm25 = BM25Index.load(os.path.join(directory, BM25_INDEX_FILENAME))
+
+    depth = max(max(ks), FETCH_K)
+    normalized = dict(zip(ids, (normalize_text(text) for text in texts)))
+    tokens = {cid: count_tokens(text) for cid, text in zip(ids, texts)}
+    query_ms, per_question = [], []
+    for question in questions:
+        query_start = time.perf_counter()
+        vector = model.encode([question["query"]], normalize_embeddings=True)[0]
+        ranking = index.query([vector], n_results=depth, include=[])["ids"][0]
+        if hybrid:
+            sparse = [cid for cid, _ in bm25.search(question["query"], depth)]
+            ranking = reciprocal_rank_fusion([ranking, sparse])
+        query_ms.append((time.perf_counter() - query_start) * 1000)
+        evidence = [normalize_text(e) for e in question["evidence"]]
+        # For each ranked chunk, which evidence strings it covers
+        covered = [{i for i, e in enumerate(evidence) if e in normalized[cid]} for cid in ranking[:max(ks)]]
+        per_question.append((len(evidence), covered, [tokens[cid] for cid in ranking[:max(ks)]]))
+
+    by_k = {}
+    for k in ks:
+        recalls, reciprocal_ranks, context_tokens = [], [], []
+        for n_evidence, covered, chunk_tokens in per_question:
+            found = set().union(*covered[:k])
+            recalls.append(len(found) / n_evidence)
+            first = next((rank for rank, hit in enumerate(covered[:k], 1) if hit), None)
+            reciprocal_ranks.append(1.0 / first if first else 0.0)
+            context_tokens.append(sum(chunk_tokens[:k]))
+        by_k[k] = {
+            "recall": statistics.mean(recalls),
+            "mrr": statistics.mean(reciprocal_ranks),
+            "context_tokens": statistics.mean(context_tokens),
+        }
+
+    ordered = sorted(query_ms[1:] or query_ms)  # the first query pays one-off warm-up costs
+    return {
+        "strategy": build["strategy"],
+        "model": build["model"],
+        "chunks": len(ids),
+        "index_mb": build["index_mb"],
+        "build_seconds": build["build_seconds"],
+        "query_ms_p50": statistics.median(ordered),
+        "query_ms_p95": ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)],
+        "by_k": by_k,
+    }
+
+
+# =========================
+# Driver
+# =========================
+
+def parse_pdfs(workers: Optional[int] = None) -> List[Tuple[str, List]]:
+    """Unstructured elements of every PDF in data/, parsed in a process pool."""
+    pdf_paths = sorted(DATA_DIR.glob("*.pdf"))
+    if not pdf_paths:
+        raise FileNotFoundError(f"No PDF files found in {DATA_DIR}")
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(pdf_paths))) as pool:
+        return list(zip((str(p) for p in pdf_paths), pool.map(load_pdf, pdf_paths)))
+
+
+def run_grid(strategies: Sequence[str], models: Sequence[str], ks: Sequence[int], questions: List[Dict],
+             hybrid: bool = True, workers: int = 2, parse_workers: Optional[int] = None,
+             threads: int = 0) -> List[Dict]:
+    """
+    Evaluate every (strategy, model) pair; one result per pair.
+
+    Indexes are built `workers` at a time, each with `threads` encoder threads
+    (0: an equal share of the cores). Query latency is measured afterwards,
+    serially in this process, so it is not skewed by concurrent builds.
+    """
+    for spec in strategies:
+        parse_strategy(spec)  # fail fast on a typo
+    ks = sorted(set(ks))
+    start = time.perf_counter()
+    parsed = parse_pdfs(parse_workers)
+    logger.info(f"Parsed {len(parsed)} PDF(s) in {time.perf_counter() - start:.2f}s")
+
+    grid = [(spec, model) for model in models for spec in strategies]
+    workers = max(1, min(workers, len(grid)))
+    # Concurrent builds share the cores instead of each starting one thread per core
+    build_threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    with tempfile.TemporaryDirectory(prefix="rag-eval-") as root:
+        directories = [os.path.join(root, str(i)) for i in range(len(grid))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(build_config, spec, model, parsed, directory, build_threads)
+                       for (spec, model), directory in zip(grid, directories)]
+            builds = []
+            for (spec, model), future in zip(grid, futures):
+                builds.append(future.result())
+                logger.info(f"Built {spec} / {model}")
+
+        # Queries are timed one index at a time, after every build has finished
+        results, encoders = [], {}
+        for build, directory in zip(builds, directories):
+            model = encoders.get(build["model"])
+            if model is None:
+                model = encoders[build["model"]] = load_sentence_model(
+                    build["model"], backend=EMBED_BACKEND, threads=threads)
+            results.append(score_config(build, directory, model, questions, ks, hybrid))
+            logger.info(f"Evaluated {build['strategy']} / {build['model']}")
+    return results
+
+
+def recommend(results: List[Dict], baseline: Tuple[str, str, int]) -> Optional[Tuple[Dict, int]]:
+    """The (result, k) with the fewest context tokens whose recall and MRR match the baseline's."""
+    spec, model, k = baseline
+    reference = next((r["by_k"].get(k) for r in results if r["strategy"] == spec and r["model"] == model), None)
+    if reference is None:
+        return None
+    candidates = [
+        (r, kk) for r in results for kk, scores in r["by_k"].items()
+        if scores["recall"] >= reference["recall"] and scores["mrr"] >= reference["mrr"]
+    ]
+    return min(candidates, key=lambda c: c[0]["by_k"][c[1]]["context_tokens"], default=None)
+
+
+def print_report(results: List[Dict], questions: List[Dict], hybrid: bool) -> None:
+    print(f"\n{len(questions)} labelled questions, {'hybrid (dense + BM25)' if hybrid else 'dense'} retrieval")
+    print(f"{'strategy':<20} {'model':<22} {'k':>3} {'recall@k':>9} {'MRR@k':>6} {'ctx tok':>8} "
+          f"{'chunks':>7} {'index MB':>9} {'build s':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in results:
+        for k, scores in sorted(r["by_k"].items()):
+            print(f"{r['strategy']:<20} {r['model'][:22]:<22} {k:>3} {scores['recall']:>9.3f} {scores['mrr']:>6.3f} "
+                  f"{scores['context_tokens']:>8.0f} {r['chunks']:>7} {r['index_mb']:>9.2f} "
+                  f"{r['build_seconds']:>8.1f} {r['query_ms_p50']:>7.1f} {r['query_ms_p95']:>7.1f}")
+
+    spec, model, k = BASELINE
+    best = recommend(results, BASELINE)
+    if best is None:
+        print(f"\nBaseline ({spec}, {model}, k={k}) not in the grid; no recommendation.")
+        return
+    r, best_k = best
+    reference = next(x["by_k"][k] for x in results if x["strategy"] == spec and x["model"] == model)
+    print(f"\nBaseline {spec} / {model} / k={k}: recall {reference['recall']:.3f}, MRR {reference['mrr']:.3f}, "
+          f"{reference['context_tokens']:.0f} context tokens")
+    print(f"Smallest prompt at least as accurate: {r['strategy']} / {r['model']} / k={best_k} "
+          f"({r['by_k'][best_k]['context_tokens']:.0f} context tokens)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="recall@k, MRR, index size and latency over a chunking/model/k grid")
+    parser.add_argument("--strategy", action="append",
+                        help="chunking strategy name[:size[:overlap]] (repeatable; default: a small grid)")
+    parser.add_argument("--model", action="append", help=f"embedding model (repeatable; default: {DEFAULT_MODEL})")
+    parser.add_argument("--k", type=int, action="append", help="retrieval depth (repeatable; default: 3, 5, 8)")
+    parser.add_argument("--questions", default=None, help="labelled questions (JSONL with query and evidence)")
+    parser.add_argument("--dense-only", action="store_true", help="skip BM25 fusion")
+    parser.add_argument("--workers", type=int, default=2, help="(strategy, model) indexes built concurrently")
+    parser.add_argument("--parse-workers", type=int, default=None, help="PDF parsing processes (default: all cores)")
+    parser.add_argument("--threads", type=int, default=0, help="encoder threads per build worker (0 = an equal share of the cores)")
+    parser.add_argument("--out", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Per-call chunking logs from rag.ingest would drown the progress lines
+    logging.getLogger("rag.ingest").setLevel(logging.WARNING)
+    questions = load_questions(args.questions) if args.questions else DEFAULT_QUESTIONS
+    hybrid = not args.dense_only
+    results = run_grid(
+        strategies=args.strategy or DEFAULT_STRATEGIES,
+        models=args.model or [DEFAULT_MODEL],
+        ks=args.k or DEFAULT_KS,
+        questions=questions,
+        hybrid=hybrid,
+        workers=args.workers,
+        parse_workers=args.parse_workers,
+        threads=args.threads,
+    )
+    print_report(results, questions, hybrid)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"hybrid": hybrid, "questions": len(questions), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
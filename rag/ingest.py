@@ -2,21 +2,71 @@
 """
 Builds the vectorstore directly from PDF files in the data/ folder.
 
+Every build goes to a new snapshot directory under
+data/vectorstore_ai/snapshots/, seeded with a copy of the active snapshot.
+Once it is complete, the data/vectorstore_ai/CURRENT pointer is atomically
+replaced with the new snapshot's name, so running apps switch to it on their
+next query (see rag/retriever.py) and nothing ever reads a half-built index.
+Older snapshots beyond the newest RAG_KEEP_SNAPSHOTS (default 2) are deleted.
+
+Ingestion is incremental: a manifest inside the snapshot records the
+SHA-256 of every PDF and the content-hash IDs of its chunks. Unchanged PDFs
+are skipped, only new or changed chunks are embedded and upserted, and chunk
+IDs that no longer exist are deleted from the store. A BM25 inverted index
+over the same chunks is rebuilt next to it whenever the chunk set changes,
+together with a memory-mapped NumPy export of the embeddings (rag/npindex.py).
+
+Each PDF is loaded as Unstructured elements and regrouped into section blocks,
+so every chunk records its source PDF (`source_type`: report, tables or
+references), page number, section heading and element type (text, list or
+table); the retriever can filter on these fields.
+
+Changed PDFs are parsed in a process pool and their chunks stream through a
+bounded queue to batched embedding threads that write to Chroma as they go,
+so memory stays bounded and every core is used.
+
 Usage:
-    python -m rag.ingest
+    python -m rag.ingest            # incremental update
+    python -m rag.ingest --rebuild  # ignore the manifest and re-embed everything
+
+With --precompute, stale precomputed answers are regenerated afterwards with
+`python -m crew.precompute` when the corpus changed (off by default: each
+question is a full LLM run).
 """
 
+import argparse
+import hashlib
+import json
 import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+import chromadb
+import numpy as np
 
 # --- UPDATED IMPORTS ---
 from langchain_community.document_loaders import UnstructuredPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.vectorstores import Chroma
 # This is the specific fix for the "ValueError: Expected metadata value to be a str..."
 from langchain_community.vectorstores.utils import filter_complex_metadata
+from langchain_core.documents import Document
+
+from rag.bm25 import INDEX_FILENAME as BM25_INDEX_FILENAME, BM25Index
+from rag.embeddings import EMBED_BACKEND
+from rag.npindex import INDEX_DIRNAME as NPINDEX_DIRNAME, MATRIX_FILENAME as NPINDEX_MATRIX_FILENAME
+from rag.npindex import export_index as export_npindex
+from rag.retriever import (
+    CURRENT_POINTER, MANIFEST_FILENAME, SNAPSHOTS_DIR, STEmbeddings, corpus_version, store_dir,
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -26,74 +76,601 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = PROJECT_ROOT / "data"
 VECTORSTORE_DIR = DATA_DIR / "vectorstore_ai"
 
+# Published snapshots kept on disk, including the active one (at least 2, so
+# queries still running on the previous snapshot can finish)
+KEEP_SNAPSHOTS = max(2, int(os.getenv("RAG_KEEP_SNAPSHOTS", "2")))
+# A snapshot without a manifest is a build in progress until nothing in it has
+# been written for this long; only then is it removed as a failed build
+ABANDONED_SNAPSHOT_SECONDS = float(os.getenv("RAG_ABANDONED_SNAPSHOT_SECONDS", str(6 * 3600)))
 
-def load_pdfs() -> List:
-    """Load all PDFs from the data/ folder as LangChain Documents."""
-    pdf_paths = sorted(DATA_DIR.glob("*.pdf"))
-    if not pdf_paths:
-        raise FileNotFoundError(f"No PDF files found in {DATA_DIR}")
+# Default collection used by langchain_community's Chroma wrapper (rag/retriever.py)
+COLLECTION_NAME = "langchain"
 
-    all_docs = []
-    for pdf_path in pdf_paths:
-        logger.info(f"Loading PDF: {pdf_path.name}")
-        # "elements" mode helps keep tables cleaner, but "fast" is okay if elements fails
-        loader = UnstructuredPDFLoader(str(pdf_path), strategy="fast") 
-        docs = loader.load()
-        logger.info(f"  -> loaded {len(docs)} document(s)")
-        all_docs.extend(docs)
+EMBEDDING_MODEL = "all-mpnet-base-v2"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 400
+# Bump when the stored chunk metadata changes so the next ingest rewrites every chunk
+METADATA_VERSION = 3
+
+# `source_type` metadata, derived from the PDF file name ("chatbot Tables.pdf" -> "tables")
+SOURCE_TYPES = ("report", "tables", "references")
+# Unstructured element categories -> `element_type` metadata (everything else is "text")
+ELEMENT_TYPES = {"Table": "table", "ListItem": "list"}
+# Page furniture that is dropped before chunking
+SKIPPED_CATEGORIES = {"Header", "Footer", "PageBreak", "PageNumber"}
+MAX_HEADING_CHARS = 200
+
+# Chroma rejects very large add/delete calls, so deletes are sent in batches
+WRITE_BATCH_SIZE = 256
+
+# Streaming pipeline defaults (overridable from the command line)
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+EMBED_THREADS = int(os.getenv("INGEST_EMBED_THREADS", "2"))
+QUEUE_BATCHES = 8  # max embedding batches buffered between parsing and embedding
+
+# Memory-mapped NumPy export (rag/npindex.py), an alternative to opening Chroma at query time
+NPINDEX_DTYPE = os.getenv("RAG_NPINDEX_DTYPE", "float32")
+
+
+def load_pdf(pdf_path: Path) -> List:
+    """Load a single PDF as LangChain Documents, one per Unstructured element."""
+    logger.info(f"Loading PDF: {pdf_path.name}")
+    # "elements" mode keeps tables apart and gives page numbers and titles
+    loader = UnstructuredPDFLoader(str(pdf_path), mode="elements", strategy="fast")
+    docs = loader.load()
+    logger.info(f"  -> loaded {len(docs)} element(s)")
+    return docs
+
+
+def source_type(pdf_path: Path) -> str:
+    """Which of the report PDFs a file is, from its name."""
+    stem = Path(pdf_path).stem.lower()
+    if "table" in stem:
+        return "tables"
+    if "reference" in stem:
+        return "references"
+    return "report"
+
+
+def group_elements(elements: List, pdf_path: Path) -> List[Document]:
+    """
+    Regroup Unstructured elements into section blocks ready for splitting.
+
+    A Title element starts a new section; each table becomes its own block.
+    Every block carries the structured metadata plus, for split_documents(),
+    its offset in the whole file and the offsets at which pages start.
+    """
+    kind = source_type(pdf_path)
+    blocks: List[Document] = []
+    section = ""
+    offset = 0
+    current = None
+    for element in elements:
+        text = (element.page_content or "").strip()
+        category = element.metadata.get("category", "")
+        if not text or category in SKIPPED_CATEGORIES:
+            continue
+        if category == "Title":
+            section = text[:MAX_HEADING_CHARS]
+        element_type = ELEMENT_TYPES.get(category, "text")
+        page = element.metadata.get("page_number")
+
+        if (current is None or category == "Title" or element_type == "table"
+                or current.metadata["element_type"] == "table"):
+            if current is not None:
+                offset += len(current.page_content) + 2
+            current = Document(page_content="", metadata={
+                "source": element.metadata.get("source", str(pdf_path)),
+                "source_type": kind,
+                "section": section,
+                "element_type": element_type,
+                "block_start": offset,
+                "page_offsets": [],
+            })
+            blocks.append(current)
+        elif current.metadata["element_type"] != element_type:
+            current.metadata["element_type"] = "text"  # mixed lists and prose
+
+        if current.page_content:
+            current.page_content += "\n\n"
+        if page is not None:
+            current.metadata["page_offsets"].append((len(current.page_content), int(page)))
+        current.page_content += text
+    return blocks
 
-    if not all_docs:
-        raise ValueError("No text extracted from any PDF.")
 
-    logger.info(f"Total documents loaded: {len(all_docs)}")
-    return all_docs
+def _page_at(page_offsets: List[Tuple[int, int]], position: int) -> Optional[int]:
+    """Page of the element containing character `position` of a block."""
+    page = page_offsets[0][1] if page_offsets else None
+    for start, element_page in page_offsets:
+        if start > position:
+            break
+        page = element_page
+    return page
 
 
-def split_documents(documents: List) -> List:
+def split_documents(documents: List, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List:
     """Split documents into chunks for embedding."""
     splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=400,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,  # character offset, used to re-merge overlapping chunks at query time
     )
     logger.info("Splitting documents into chunks...")
     chunks = splitter.split_documents(documents)
+    for i, chunk in enumerate(chunks):
+        # Blocks from group_elements(): make offsets file-relative and resolve the page
+        block_start = chunk.metadata.pop("block_start", 0)
+        page_offsets = chunk.metadata.pop("page_offsets", None)
+        start = chunk.metadata.get("start_index", 0)
+        if page_offsets:
+            chunk.metadata["page"] = _page_at(page_offsets, start)
+        if start >= 0:
+            chunk.metadata["start_index"] = block_start + start
+        chunk.metadata["chunk_index"] = i
     logger.info(f"Total chunks: {len(chunks)}")
     return chunks
 
 
-def build_vectorstore() -> None:
-    """Load PDFs, chunk them, and persist a Chroma vectorstore."""
-    logger.info("Starting PDF ingestion pipeline...")
+# =========================
+# Manifest
+# =========================
+
+def file_sha256(path: Path) -> str:
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(chunks: List, source_name: str) -> List[str]:
+    """
+    Derive stable content-hash IDs for the chunks of one file.
+
+    Identical chunks inside the same file get an occurrence suffix so every
+    ID stays unique.
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha256(f"{source_name}\n{chunk.page_content}".encode("utf-8")).hexdigest()
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        ids.append(digest if n == 0 else f"{digest}-{n}")
+    return ids
+
+
+def ingest_settings() -> Dict:
+    """Settings that invalidate every stored embedding when they change."""
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_backend": EMBED_BACKEND,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "metadata_version": METADATA_VERSION,
+    }
+
+
+def load_manifest(directory: Path) -> Dict:
+    """Return the ingest manifest of a snapshot, or an empty one if none exists."""
+    path = directory / MANIFEST_FILENAME
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(manifest: Dict, directory: Path) -> None:
+    """Write the manifest atomically so a crash never leaves a partial file."""
+    path = directory / MANIFEST_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# =========================
+# Snapshots
+# =========================
+
+def new_snapshot_name() -> str:
+    """Snapshot directory name; names sort by creation time."""
+    return time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def _active_is_current(active: Path, digests: Dict[str, str], npindex_dtype: str) -> bool:
+    """True if the active snapshot already indexes exactly these PDFs, with current settings and indexes."""
+    manifest = load_manifest(active)
+    if manifest.get("settings") != ingest_settings():
+        return False
+    files = manifest.get("files", {})
+    if {name: entry.get("sha256") for name, entry in files.items()} != digests:
+        return False
+    return (active / BM25_INDEX_FILENAME).exists() and _npindex_current(active / NPINDEX_DIRNAME, npindex_dtype)
+
+
+def seed_snapshot(source: Path, target: Path) -> None:
+    """Start a snapshot as a copy of `source` (the active store) so the build stays incremental."""
+    if not (source / "chroma.sqlite3").exists():
+        target.mkdir(parents=True)
+        return
+    start = time.perf_counter()
+    # A store built before snapshots is CHROMA_DIR itself, which also holds the snapshots
+    shutil.copytree(source, target, ignore=shutil.ignore_patterns("snapshots", "CURRENT*", "*.tmp"))
+    logger.info(f"Seeded snapshot {target.name} from {source} in {time.perf_counter() - start:.2f}s")
+
+
+def publish_snapshot(name: str) -> None:
+    """Make snapshot `name` the active index by atomically replacing the CURRENT pointer."""
+    tmp_path = CURRENT_POINTER + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CURRENT_POINTER)
+    logger.info(f"Published snapshot {name}")
+
+
+def _last_write(directory: Path) -> float:
+    """Newest modification time of `directory` or anything inside it."""
+    latest = directory.stat().st_mtime
+    for root, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            try:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime)
+            except OSError:
+                pass  # removed while we were walking
+    return latest
 
-    docs = load_pdfs()
-    chunks = split_documents(docs)
 
+def gc_snapshots(keep: int = KEEP_SNAPSHOTS) -> List[str]:
+    """
+    Delete all but the newest `keep` published snapshots (never the active one),
+    plus the leftovers of failed builds; returns the names removed.
+
+    A snapshot without a manifest may be another ingest still building, so it
+    is only removed once untouched for ABANDONED_SNAPSHOT_SECONDS. A store
+    built before snapshots (CHROMA_DIR itself) is left alone.
+    """
+    root = Path(SNAPSHOTS_DIR)
+    if not root.is_dir():
+        return []
+    active = Path(store_dir()).name
+    cutoff = time.time() - ABANDONED_SNAPSHOT_SECONDS
+    published, failed = [], []
+    for entry in sorted(root.iterdir(), reverse=True):
+        if not entry.is_dir() or entry.name == active:
+            continue
+        if (entry / MANIFEST_FILENAME).exists():
+            published.append(entry)
+        elif _last_write(entry) < cutoff:
+            failed.append(entry)
+    removed = []
+    for entry in published[keep - 1:] + failed:
+        try:
+            shutil.rmtree(entry)
+        except OSError as e:
+            # e.g. files still open by another process on Windows; retried on the next ingest
+            logger.warning(f"Could not delete old snapshot {entry.name}: {e}")
+            continue
+        removed.append(entry.name)
+    if removed:
+        logger.info(f"Deleted {len(removed)} old snapshot(s): {', '.join(removed)}")
+    return removed
+
+
+# =========================
+# Pipeline
+# =========================
+
+class _StageStats:
+    """Counts items flowing through one pipeline stage and logs its throughput."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for key, n in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + n
+
+    def log(self) -> None:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        rates = ", ".join(f"{n} {key} ({n / elapsed:.1f} {key}/sec)" for key, n in self.counts.items())
+        logger.info(f"[{self.name}] {rates or 'nothing to do'} in {elapsed:.2f}s")
+
+
+def _parse_pdf(pdf_path: str) -> Tuple[int, List]:
+    """Process-pool worker: load, group into sections, split and clean one PDF."""
+    elements = load_pdf(Path(pdf_path))
     # --- THE FIX: Filter out the complex 'coordinates' metadata ---
-    logger.info("Filtering complex metadata to prevent ChromaDB errors...")
-    chunks = filter_complex_metadata(chunks)
-
-    # Use the smarter embedding model (mpnet) instead of the basic one (MiniLM)
-    embeddings = SentenceTransformerEmbeddings(model_name="all-mpnet-base-v2")
-
-    logger.info(f"Building Chroma vectorstore at: {VECTORSTORE_DIR}")
-    
-    # Check if directory exists and warn (optional)
-    # Chroma will overwrite/append, but sometimes a clean start is better.
-    
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=str(VECTORSTORE_DIR),
-    )
-    # .persist() is automatic in newer Chroma versions, but keeping it is safe
+    chunks = filter_complex_metadata(split_documents(group_elements(elements, Path(pdf_path))))
+    return len(elements), chunks
+
+
+def _embed_worker(batches: "queue.Queue", embeddings, collection, write_lock: threading.Lock,
+                  embed_stats: _StageStats, write_stats: _StageStats, errors: List[BaseException]) -> None:
+    """Embedding thread (with its own model): pull chunk batches off the queue, embed them, and bulk-upsert into Chroma."""
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        if errors:
+            continue  # keep draining so the producer never blocks on a full queue
+        try:
+            texts = [chunk.page_content for _, chunk in batch]
+            vectors = embeddings.embed_documents(texts)
+            embed_stats.add(chunks=len(batch))
+            with write_lock:
+                collection.upsert(
+                    ids=[cid for cid, _ in batch],
+                    embeddings=vectors,
+                    metadatas=[chunk.metadata for _, chunk in batch],
+                    documents=texts,
+                )
+            write_stats.add(chunks=len(batch))
+        except BaseException as e:
+            errors.append(e)
+
+
+def build_bm25_index(collection, path: Path) -> None:
+    """Rebuild the BM25 inverted index over every chunk currently in the collection."""
+    start = time.perf_counter()
+    stored = collection.get(include=["documents"])
+    index = BM25Index.build(stored["ids"], stored["documents"])
+    index.save(str(path))
+    logger.info(f"BM25 index: {len(index)} chunk(s), {len(index.postings)} term(s) "
+                f"in {time.perf_counter() - start:.2f}s -> {path.name}")
+
+
+def _npindex_current(directory: Path, dtype: str) -> bool:
+    """True if an exported NumPy index with the requested dtype already exists."""
+    matrix_path = directory / NPINDEX_MATRIX_FILENAME
+    if not matrix_path.exists():
+        return False
+    return str(np.load(matrix_path, mmap_mode="r").dtype) == dtype
+
+
+def export_numpy_index(collection, directory: Path, dtype: str = NPINDEX_DTYPE) -> None:
+    """Export every chunk's embedding, text and metadata for the memory-mapped NumPy backend."""
+    start = time.perf_counter()
+    stored = collection.get(include=["embeddings", "documents", "metadatas"])
+    export_npindex(str(directory), stored["ids"], stored["embeddings"], stored["documents"],
+                   stored["metadatas"], dtype=dtype)
+    logger.info(f"NumPy index: {len(stored['ids'])} {dtype} vector(s) "
+                f"in {time.perf_counter() - start:.2f}s -> {directory}")
+
+
+# =========================
+# Build
+# =========================
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def _max_batch_size(client) -> Optional[int]:
+    """Largest upsert Chroma accepts in one call (None if this version does not say)."""
     try:
-        vectordb.persist()
-    except AttributeError:
-        pass # Newer versions persist automatically
+        return int(client.get_max_batch_size())
+    except Exception:
+        return None
 
-    logger.info("Vectorstore successfully saved.")
+
+def _batches(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def build_vectorstore(
+    rebuild: bool = False,
+    parse_workers: Optional[int] = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    embed_threads: int = EMBED_THREADS,
+    npindex_dtype: str = NPINDEX_DTYPE,
+    keep_snapshots: int = KEEP_SNAPSHOTS,
+) -> None:
+    """
+    Incrementally sync the Chroma vectorstore with the PDFs in data/.
+
+    If the active snapshot's manifest already matches every PDF's digest,
+    nothing is copied or opened. Otherwise the sync runs on a new snapshot
+    seeded from the active one (empty with `rebuild=True`), which is
+    published only once complete; if nothing changed after all it is
+    discarded and the active snapshot stays live.
+
+    Changed PDFs are parsed in a process pool; their new chunks stream through
+    a bounded queue to `embed_threads` embedding threads, which upsert each
+    batch of `batch_size` chunks into Chroma as soon as it is embedded.
+    """
+    logger.info("Starting PDF ingestion pipeline...")
+
+    pdf_paths = sorted(DATA_DIR.glob("*.pdf"))
+    if not pdf_paths:
+        raise FileNotFoundError(f"No PDF files found in {DATA_DIR}")
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    if embed_threads < 1:
+        raise ValueError(f"embed_threads must be at least 1, got {embed_threads}")
+    if parse_workers is not None and parse_workers < 1:
+        raise ValueError(f"parse_workers must be at least 1, got {parse_workers}")
+
+    digests = {pdf_path.name: file_sha256(pdf_path) for pdf_path in pdf_paths}
+    active = Path(store_dir())
+    if not rebuild and _active_is_current(active, digests, npindex_dtype):
+        # Checked before seeding, which copies the whole store
+        logger.info(f"Nothing changed; keeping the active snapshot {active.name}.")
+        print("success")
+        return
+
+    snapshot = Path(SNAPSHOTS_DIR) / new_snapshot_name()
+    if rebuild:
+        snapshot.mkdir(parents=True)
+    else:
+        seed_snapshot(active, snapshot)
+
+    logger.info(f"Opening Chroma vectorstore at: {snapshot}")
+    client = chromadb.PersistentClient(path=str(snapshot))
+    collection = client.get_or_create_collection(COLLECTION_NAME)
+    max_batch = _max_batch_size(client)
+    if max_batch and batch_size > max_batch:
+        logger.info(f"Batch size {batch_size} exceeds Chroma's limit; using {max_batch}")
+        batch_size = max_batch
+    store_ids = set(collection.get(include=[])["ids"])
+
+    manifest = {} if rebuild else load_manifest(snapshot)
+    settings = ingest_settings()
+    previous_files = manifest.get("files", {})
+    if manifest.get("settings") != settings:
+        # No usable manifest (first run, legacy store, or new model/chunking):
+        # nothing stored can be trusted, so start from an empty collection.
+        if store_ids:
+            logger.info(f"Clearing {len(store_ids)} chunk(s) that are not tracked by the current manifest")
+            for batch in _batches(sorted(store_ids), WRITE_BATCH_SIZE):
+                collection.delete(ids=batch)
+        store_ids = set()
+        previous_files = {}
+
+    files = {}
+    to_parse = []
+    for pdf_path in pdf_paths:
+        digest = digests[pdf_path.name]
+        previous = previous_files.get(pdf_path.name)
+        if previous and previous["sha256"] == digest and store_ids.issuperset(previous["chunks"]):
+            logger.info(f"Unchanged: {pdf_path.name} ({len(previous['chunks'])} chunks)")
+            files[pdf_path.name] = previous
+        else:
+            to_parse.append((pdf_path, digest))
+
+    parse_stats = _StageStats("parse")
+    embed_stats = _StageStats("embed")
+    write_stats = _StageStats("write")
+    if to_parse:
+        batches: "queue.Queue" = queue.Queue(maxsize=QUEUE_BATCHES)
+        write_lock = threading.Lock()
+        errors: List[BaseException] = []
+        # One model per thread: a SentenceTransformer's fast tokenizer must not be called from
+        # two threads at once ("Already borrowed"), so a shared model would need a lock around
+        # every encode. Each copy costs the model's memory. Chroma writes go through write_lock.
+        # Use the smarter embedding model (mpnet) instead of the basic one (MiniLM)
+        threads = [
+            threading.Thread(
+                target=_embed_worker,
+                args=(batches, STEmbeddings(model_name=EMBEDDING_MODEL, backend=EMBED_BACKEND),
+                      collection, write_lock, embed_stats, write_stats, errors),
+                daemon=True,
+            )
+            for _ in range(embed_threads)
+        ]
+        for thread in threads:
+            thread.start()
+
+        workers = min(parse_workers or os.cpu_count() or 1, len(to_parse))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_parse_pdf, str(path)): (path, digest) for path, digest in to_parse}
+                buffer = []
+                # Unchanged text keeps its content-hash ID, but its position (start_index,
+                # chunk_index, page, section) may have moved in the edited file
+                moved = []
+                for future in as_completed(futures):
+                    pdf_path, digest = futures[future]
+                    n_docs, chunks = future.result()
+                    parse_stats.add(docs=n_docs, chunks=len(chunks))
+                    ids = chunk_ids(chunks, pdf_path.name)
+                    files[pdf_path.name] = {"sha256": digest, "chunks": ids}
+                    new = [(cid, chunk) for cid, chunk in zip(ids, chunks) if cid not in store_ids]
+                    moved.extend((cid, chunk) for cid, chunk in zip(ids, chunks) if cid in store_ids)
+                    logger.info(f"{pdf_path.name}: {len(new)} new or changed chunk(s) out of {len(ids)}")
+                    buffer.extend(new)
+                    while len(buffer) >= batch_size:
+                        batches.put(buffer[:batch_size])
+                        buffer = buffer[batch_size:]
+                if buffer:
+                    batches.put(buffer)
+        finally:
+            for _ in threads:
+                batches.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        for batch in _batches(moved, WRITE_BATCH_SIZE):
+            collection.update(ids=[cid for cid, _ in batch], metadatas=[chunk.metadata for _, chunk in batch])
+        write_stats.add(metadata=len(moved))
+    parse_stats.log()
+    embed_stats.log()
+    write_stats.log()
+
+    live_ids = {cid for entry in files.values() for cid in entry["chunks"]}
+    stale_ids = sorted(store_ids - live_ids)
+    for batch in _batches(stale_ids, WRITE_BATCH_SIZE):
+        collection.delete(ids=batch)
+    logger.info(f"Deleted {len(stale_ids)} stale chunk(s)")
+
+    changed = rebuild or bool(to_parse or stale_ids)
+    bm25_path = snapshot / BM25_INDEX_FILENAME
+    if to_parse or stale_ids or not bm25_path.exists():
+        build_bm25_index(collection, bm25_path)
+        changed = True
+    npindex_dir = snapshot / NPINDEX_DIRNAME
+    if to_parse or stale_ids or not _npindex_current(npindex_dir, npindex_dtype):
+        export_numpy_index(collection, npindex_dir, npindex_dtype)
+        changed = True
+
+    new_manifest = {"settings": settings, "files": files}
+    if not changed and new_manifest == manifest:
+        logger.info(f"Nothing changed; keeping the active snapshot ({collection.count()} chunks).")
+        # Without a manifest, a copy that cannot be deleted now is removed by the next gc_snapshots()
+        shutil.rmtree(snapshot, ignore_errors=True)
+        print("success")
+        return
+
+    save_manifest(new_manifest, snapshot)
+    logger.info(f"Vectorstore successfully saved ({collection.count()} chunks).")
+    publish_snapshot(snapshot.name)
+    gc_snapshots(max(2, keep_snapshots))
     print("success")
 
 
 if __name__ == "__main__":
-    build_vectorstore()
+    parser = argparse.ArgumentParser(description="Sync the Chroma vectorstore with data/*.pdf")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the manifest and re-embed every chunk")
+    parser.add_argument("--parse-workers", type=_positive_int, default=None, help="PDF parsing processes (default: all cores)")
+    parser.add_argument("--batch-size", type=_positive_int, default=EMBED_BATCH_SIZE, help="chunks per embedding/write batch")
+    parser.add_argument("--embed-threads", type=_positive_int, default=EMBED_THREADS, help="embedding worker threads")
+    parser.add_argument("--npindex-dtype", choices=["float32", "float16"], default=NPINDEX_DTYPE,
+                        help="dtype of the exported memory-mapped NumPy index")
+    parser.add_argument("--keep-snapshots", type=int, default=KEEP_SNAPSHOTS,
+                        help="published snapshots to keep, including the active one (min 2)")
+    parser.add_argument("--precompute", action="store_true",
+                        help="regenerate precomputed answers if the corpus changed (one LLM run per question)")
+    args = parser.parse_args()
+    version_before = corpus_version()
+    build_vectorstore(
+        rebuild=args.rebuild,
+        parse_workers=args.parse_workers,
+        batch_size=args.batch_size,
+        embed_threads=args.embed_threads,
+        npindex_dtype=args.npindex_dtype,
+        keep_snapshots=args.keep_snapshots,
+    )
+    if args.precompute and corpus_version() != version_before:
+        # Precomputed answers are tied to the corpus version; rebuild the stale ones.
+        # Run as a separate process because the answering side lives in crew/.
+        logger.info("Corpus changed; regenerating precomputed answers")
+        subprocess.run([sys.executable, "-m", "crew.precompute"], cwd=PROJECT_ROOT, check=False)
@@ -0,0 +1,151 @@
+# rag/npindex.py
+"""
+Zero-dependency (NumPy only) memory-mapped vector index.
+
+For a small, read-mostly corpus, opening Chroma's SQLite + HNSW store is a
+large share of startup time and memory. rag/ingest.py therefore also exports:
+
+    <vectorstore>/npindex/embeddings.npy   contiguous float32/float16 matrix
+    <vectorstore>/npindex/meta.json        ids, documents and metadatas
+
+NumpyIndex memory-maps the matrix (so worker processes share the same pages)
+and does exact top-k with one vectorised dot product. It implements the small
+subset of the chromadb Collection API that the retriever uses (`query`,
+`get`, `count`), so it can be used instead of Chroma with RAG_VECTOR_BACKEND=numpy.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+INDEX_DIRNAME = "npindex"
+MATRIX_FILENAME = "embeddings.npy"
+META_FILENAME = "meta.json"
+
+
+def export_index(directory: str, ids: Sequence[str], embeddings, documents: Sequence[str],
+                 metadatas: Sequence[dict], dtype: str = "float32") -> None:
+    """Write the matrix and metadata files (each replaced atomically)."""
+    os.makedirs(directory, exist_ok=True)
+    if len(ids) == 0:
+        # An empty collection has no embedding width to reshape to
+        matrix = np.zeros((0, 0), dtype=dtype)
+    else:
+        matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=dtype).reshape(len(ids), -1))
+    matrix_path = os.path.join(directory, MATRIX_FILENAME)
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, matrix)
+    os.replace(matrix_path + ".tmp", matrix_path)
+
+    meta_path = os.path.join(directory, META_FILENAME)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"ids": list(ids), "documents": list(documents),
+                   "metadatas": [m or {} for m in metadatas]}, f, separators=(",", ":"))
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+# =========================
+# Metadata filters (Chroma `where` syntax subset)
+# =========================
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+}
+
+
+def matches(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluate a Chroma-style `where` clause against one metadata dict."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, arg in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator {op!r}")
+                if not _OPERATORS[op](value, arg):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyIndex:
+    """Exact dot-product search over a memory-mapped embedding matrix."""
+
+    def __init__(self, directory: str):
+        self.matrix = np.load(os.path.join(directory, MATRIX_FILENAME), mmap_mode="r")
+        with open(os.path.join(directory, META_FILENAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids: List[str] = meta["ids"]
+        self.documents: List[str] = meta["documents"]
+        self.metadatas: List[dict] = meta["metadatas"]
+        self._positions: Dict[str, int] = {cid: i for i, cid in enumerate(self.ids)}
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None,
+              include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        """Chroma-compatible `query` (cosine on normalised vectors; higher is better)."""
+        candidates = None
+        if where:
+            candidates = np.fromiter((i for i, m in enumerate(self.metadatas) if matches(m, where)), dtype=np.int64)
+
+        result = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+        for vector in query_embeddings:
+            q = np.asarray(vector, dtype=np.float32)
+            if not self.ids:
+                for key in result:
+                    result[key].append([])
+                continue
+            if candidates is None:
+                scores = self.matrix @ q.astype(self.matrix.dtype)
+                rows = np.arange(len(self.ids))
+            else:
+                scores = self.matrix[candidates] @ q.astype(self.matrix.dtype)
+                rows = candidates
+            k = min(n_results, len(rows))
+            if k == 0:
+                top = np.empty(0, dtype=np.int64)
+            else:
+                part = np.argpartition(-scores, k - 1)[:k]
+                top = part[np.argsort(-scores[part])]
+            picked = [int(rows[i]) for i in top]
+            result["ids"].append([self.ids[i] for i in picked])
+            result["distances"].append([float(1.0 - scores[i]) for i in top])
+            result["documents"].append([self.documents[i] for i in picked])
+            result["metadatas"].append([self.metadatas[i] for i in picked])
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        """Chroma-compatible `get` by IDs and/or filter."""
+        if ids is None:
+            rows = range(len(self.ids))
+        else:
+            rows = [self._positions[cid] for cid in ids if cid in self._positions]
+        rows = [i for i in rows if matches(self.metadatas[i], where)]
+        result = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.matrix[rows], dtype=np.float32)
+        return result
@@ -0,0 +1,190 @@
+# rag/packing.py
+"""
+Token-budgeted context packing for retrieved chunks.
+
+Chunks are split with a 400-character overlap, so neighbouring hits repeat
+much of each other's text. pack_context() turns a ranked list of chunks into a
+compact context string:
+
+1. chunks from the same source are sorted by document position and
+   overlapping or adjacent ones are merged into a single passage
+2. near-duplicate passages (high word-shingle overlap) are dropped
+3. sources are ordered by their best retrieval rank, passages by position
+4. the result is cut to a token budget measured with tiktoken
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from langchain_core.documents import Document
+
+from rag.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+PACK_ENABLED = os.getenv("RAG_PACK_CONTEXT", "1") != "0"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2000"))
+DUPLICATE_THRESHOLD = 0.8   # word-shingle Jaccard above which a passage is a near-duplicate
+MIN_OVERLAP_CHARS = 20      # shortest text overlap accepted when start offsets are unavailable
+ADJACENT_GAP_CHARS = 2      # chunks separated by at most this many characters are merged
+SEPARATOR = "\n\n"
+
+_totals = {"queries": 0, "tokens_before": 0, "tokens_after": 0}
+_totals_lock = threading.Lock()
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    passages: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+@dataclass
+class _Passage:
+    source: str
+    rank: int              # best retrieval rank among the merged chunks
+    start: Optional[int]   # character offset in the source, if known
+    text: str
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right` (0 if under the minimum)."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _try_merge(a: _Passage, b: _Passage) -> bool:
+    """Append `b` to `a` if they overlap or touch; return whether they were merged."""
+    if a.start is not None and b.start is not None:
+        # Offsets can be stale, so a merge that drops text is only trusted if the text agrees
+        if b.end <= a.end and b.text in a.text:
+            a.rank = min(a.rank, b.rank)
+            return True  # b lies inside a
+        gap = b.start - a.end
+        if b.end > a.end and gap < 0 and a.text.endswith(b.text[:-gap]):
+            a.text += b.text[-gap:]
+            a.rank = min(a.rank, b.rank)
+            return True
+        if 0 <= gap <= ADJACENT_GAP_CHARS:
+            a.text += " " + b.text
+            a.rank = min(a.rank, b.rank)
+            return True
+        if gap > ADJACENT_GAP_CHARS:
+            return False
+
+    # Without (trustworthy) offsets the chunks are in retrieval order, so try both directions
+    overlap = _overlap_length(a.text, b.text)
+    if overlap:
+        a.text += b.text[overlap:]
+    else:
+        overlap = _overlap_length(b.text, a.text)
+        if not overlap:
+            return False
+        a.text = b.text + a.text[overlap:]
+    a.rank = min(a.rank, b.rank)
+    return True
+
+
+def _shingles(text: str, size: int = 5) -> Set[tuple]:
+    words = text.lower().split()
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def _is_near_duplicate(candidate: Set[tuple], kept: List[Set[tuple]]) -> bool:
+    for other in kept:
+        if not candidate or not other:
+            continue
+        inter = len(candidate & other)
+        # Jaccard, or containment of the smaller passage in the larger one
+        if inter / len(candidate | other) >= DUPLICATE_THRESHOLD or inter / min(len(candidate), len(other)) >= 0.95:
+            return True
+    return False
+
+
+def pack_context(docs: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET) -> PackedContext:
+    """Merge, de-duplicate, order and budget `docs` (given in retrieval order)."""
+    raw = [(d.page_content or "").strip() for d in docs]
+    tokens_before = count_tokens(SEPARATOR.join(t for t in raw if t))
+
+    # 1. group by source and merge overlapping/adjacent chunks in document order
+    by_source: Dict[str, List[_Passage]] = {}
+    for rank, (doc, text) in enumerate(zip(docs, raw)):
+        if not text:
+            continue
+        source = str(doc.metadata.get("source", ""))
+        start = doc.metadata.get("start_index")
+        by_source.setdefault(source, []).append(
+            _Passage(source, rank, start if isinstance(start, int) else None, text)
+        )
+    merged: List[_Passage] = []
+    for passages in by_source.values():
+        if all(p.start is not None for p in passages):
+            passages.sort(key=lambda p: p.start)
+        current = passages[0]
+        for nxt in passages[1:]:
+            if not _try_merge(current, nxt):
+                merged.append(current)
+                current = nxt
+        merged.append(current)
+
+    # 2. drop near-duplicates, keeping the better-ranked passage
+    kept, kept_shingles = [], []
+    for passage in sorted(merged, key=lambda p: p.rank):
+        shingles = _shingles(passage.text)
+        if _is_near_duplicate(shingles, kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+
+    # 3. sources by best rank, passages by position within each source
+    source_rank: Dict[str, int] = {}
+    for passage in kept:
+        source_rank[passage.source] = min(source_rank.get(passage.source, passage.rank), passage.rank)
+    kept.sort(key=lambda p: (source_rank[p.source], p.start if p.start is not None else p.rank))
+
+    # 4. fill the token budget
+    texts, used = [], 0
+    sep_tokens = count_tokens(SEPARATOR)
+    for passage in kept:
+        cost = count_tokens(passage.text) + (sep_tokens if texts else 0)
+        if used + cost <= token_budget:
+            texts.append(passage.text)
+            used += cost
+            continue
+        remaining = token_budget - used - (sep_tokens if texts else 0)
+        if remaining > 50:
+            texts.append(truncate_to_tokens(passage.text, remaining))
+        break
+
+    text = SEPARATOR.join(texts)
+    packed = PackedContext(text=text, tokens_before=tokens_before, tokens_after=count_tokens(text), passages=texts)
+    with _totals_lock:
+        _totals["queries"] += 1
+        _totals["tokens_before"] += packed.tokens_before
+        _totals["tokens_after"] += packed.tokens_after
+    logger.info(f"Packed {len(docs)} chunk(s) into {len(texts)} passage(s): "
+                f"{packed.tokens_before} -> {packed.tokens_after} tokens ({packed.tokens_saved} saved)")
+    return packed
+
+
+def packing_stats() -> Dict[str, int]:
+    """Cumulative token counts before/after packing."""
+    with _totals_lock:
+        stats = dict(_totals)
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    return stats
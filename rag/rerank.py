@@ -0,0 +1,106 @@
+# rag/rerank.py
+"""
+Optional CPU cross-encoder reranking of retrieved chunks.
+
+The retriever over-fetches candidates; a small local cross-encoder scores
+(query, chunk) pairs in batches, and the best chunks are kept until a token
+budget is full. Scoring runs in batches of RERANK_BATCH_SIZE pairs under a
+time budget checked before every batch, the last one included: a batch is
+only started if the time used so far plus the previous batch's duration
+fits, otherwise the dense (retriever) order is used instead. Only the first
+batch, which has no previous duration to go by, can overrun the budget.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from rag.retriever import shared_resource
+from rag.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RAG_RERANK", "0") != "0"
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RERANK_TOKEN_BUDGET = int(os.getenv("RAG_RERANK_TOKEN_BUDGET", "1500"))
+RERANK_TIME_BUDGET = float(os.getenv("RAG_RERANK_TIME_BUDGET", "0.3"))
+RERANK_BATCH_SIZE = 8
+
+_stats: Dict[str, int] = {"reranked": 0, "fallbacks": 0}
+_stats_lock = threading.Lock()
+
+
+def get_cross_encoder(model_name: str = RERANK_MODEL):
+    """Shared CrossEncoder, loaded on first use (CPU)."""
+    def _load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device="cpu")
+    return shared_resource(("cross_encoder", model_name), _load)
+
+
+def fit_token_budget(docs: List[Document], token_budget: int) -> List[Document]:
+    """Keep documents in order while they fit `token_budget` (always keeps the first)."""
+    kept, used = [], 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if kept and used + tokens > token_budget:
+            continue  # a shorter chunk further down may still fit
+        kept.append(doc)
+        used += tokens
+    return kept
+
+
+def rerank(
+    query: str,
+    docs: List[Document],
+    token_budget: int = RERANK_TOKEN_BUDGET,
+    time_budget: float = RERANK_TIME_BUDGET,
+    model_name: str = RERANK_MODEL,
+) -> List[Document]:
+    """
+    Reorder `docs` by cross-encoder score and trim them to `token_budget`.
+
+    Falls back to the incoming (dense) order when the next batch would not
+    finish within `time_budget` seconds, or when scoring fails.
+    """
+    if len(docs) <= 1:
+        return fit_token_budget(docs, token_budget)
+
+    start = time.perf_counter()
+    scores: Optional[List[float]] = []
+    try:
+        model = get_cross_encoder(model_name)
+        start = time.perf_counter()  # the budget covers scoring, not the one-off model load
+        batch_seconds = 0.0
+        for offset in range(0, len(docs), RERANK_BATCH_SIZE):
+            batch_start = time.perf_counter()
+            if batch_start - start + batch_seconds > time_budget:
+                logger.info(f"Rerank would exceed its {time_budget:.2f}s budget; using dense order")
+                scores = None
+                break
+            batch = docs[offset:offset + RERANK_BATCH_SIZE]
+            scores.extend(float(s) for s in model.predict([(query, d.page_content) for d in batch]))
+            batch_seconds = time.perf_counter() - batch_start
+    except Exception:
+        logger.exception("Rerank failed; using dense order")
+        scores = None
+
+    if scores is None:
+        with _stats_lock:
+            _stats["fallbacks"] += 1
+        return fit_token_budget(docs, token_budget)
+
+    with _stats_lock:
+        _stats["reranked"] += 1
+    ranked = [doc for _, doc in sorted(zip(scores, docs), key=lambda pair: pair[0], reverse=True)]
+    return fit_token_budget(ranked, token_budget)
+
+
+def rerank_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
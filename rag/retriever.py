@@ -1,30 +1,473 @@
 # rag/retriever.py
+"""
+Shared retrieval resources and the cached hybrid retriever.
 
+rag/ingest.py writes every index build to a new snapshot directory under
+data/vectorstore_ai/snapshots/ and then atomically replaces the one-line
+data/vectorstore_ai/CURRENT pointer with its name. Each query resolves the
+pointer once (a single stat() when nothing changed) and runs entirely on
+that snapshot, so a query in flight during a swap finishes on the old index
+while the next one opens the new index. On a swap the query caches are
+cleared and the old snapshot's resources are released. Without a pointer
+(a store built before snapshots) CHROMA_DIR itself is the index.
+"""
+
+import hashlib
+import logging
 import os
-from sentence_transformers import SentenceTransformer
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional
+
 from langchain.embeddings.base import Embeddings
 from langchain_community.vectorstores import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from rag.bm25 import INDEX_FILENAME as BM25_INDEX_FILENAME, BM25Index, reciprocal_rank_fusion
+from rag.embeddings import EMBED_BACKEND, EMBED_THREADS, load_sentence_model
+from rag.tracing import span
+
+logger = logging.getLogger(__name__)
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 CHROMA_DIR = os.path.join(DATA_DIR, "vectorstore_ai")
+# Index snapshots written by rag/ingest.py, and the file naming the active one
+SNAPSHOTS_DIR = os.path.join(CHROMA_DIR, "snapshots")
+CURRENT_POINTER = os.path.join(CHROMA_DIR, "CURRENT")
+# Written by rag/ingest.py into each snapshot; its contents identify the indexed corpus
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+# Default collection used by langchain_community's Chroma wrapper (and rag/ingest.py)
+COLLECTION_NAME = "langchain"
+
+DEFAULT_MODEL = "all-mpnet-base-v2"
+
+# "chroma" (default) or "numpy" (memory-mapped export, see rag/npindex.py)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")
+
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+# Fuse BM25 with dense retrieval when RAG_HYBRID=1 (opt-in; dense-only by default)
+HYBRID_DEFAULT = os.getenv("RAG_HYBRID", "0") == "1"
+# With a metadata filter, BM25 over-fetches this many times `fetch_k` before filtering
+BM25_FILTER_OVERFETCH = 4
+# After a snapshot swap, the old snapshot's Chroma files are closed this long after the switch
+RELEASE_DELAY_SECONDS = float(os.getenv("RAG_RELEASE_DELAY", "120"))
+
+
+# =========================
+# Query caches
+# =========================
+
+class _LRU:
+    """Small thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# (model_name, backend, query text) -> normalised query vector
+_embedding_cache = _LRU(QUERY_CACHE_SIZE)
+# (snapshot, vector hash, k, filter) -> ordered document IDs
+_search_cache = _LRU(QUERY_CACHE_SIZE)
+_encode_seconds = 0.0
+_encode_calls = 0
+_cached_corpus_version: Optional[str] = None
+_active_dir: Optional[str] = None
+
+
+def invalidate_query_caches() -> None:
+    """Drop every cached query vector and search result."""
+    _embedding_cache.clear()
+    _search_cache.clear()
+
+
+def _check_corpus_version() -> str:
+    """
+    Active snapshot directory for one query.
+
+    When the snapshot or the corpus version changed since the previous query,
+    the query caches are cleared and the old snapshot's shared resources are
+    released (queries still running on it keep their own references).
+    """
+    global _cached_corpus_version, _active_dir
+    directory = store_dir()
+    version = corpus_version(directory)
+    if version != _cached_corpus_version or directory != _active_dir:
+        if _cached_corpus_version is not None:
+            logger.info(f"Corpus version changed ({_cached_corpus_version} -> {version}); clearing query caches")
+        invalidate_query_caches()
+        if _active_dir is not None and _active_dir != directory:
+            logger.info(f"Switched index snapshot: {_active_dir} -> {directory}")
+            release_snapshot(_active_dir)
+        _cached_corpus_version, _active_dir = version, directory
+    return directory
+
+
+def cache_stats() -> Dict[str, float]:
+    """Counters for the query caches, including encoder time saved by hits."""
+    mean_encode = _encode_seconds / _encode_calls if _encode_calls else 0.0
+    return {
+        "embedding_hits": _embedding_cache.hits,
+        "embedding_misses": _embedding_cache.misses,
+        "embedding_entries": len(_embedding_cache),
+        "encode_seconds": _encode_seconds,
+        "encode_seconds_saved": _embedding_cache.hits * mean_encode,
+        "search_hits": _search_cache.hits,
+        "search_misses": _search_cache.misses,
+        "search_entries": len(_search_cache),
+    }
 
 
 class STEmbeddings(Embeddings):
     #def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-    def __init__(self, model_name: str = "all-mpnet-base-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = DEFAULT_MODEL, backend: str = EMBED_BACKEND, threads: int = EMBED_THREADS):
+        # Loaded lazily so that importing this module does not pull in torch
+        self.model_name = model_name
+        self.backend = backend
+        self.model = load_sentence_model(model_name, backend=backend, threads=threads)
     def embed_documents(self, texts):
         return self.model.encode(texts, normalize_embeddings=True).tolist()
     def embed_query(self, text):
-        return self.model.encode([text], normalize_embeddings=True)[0].tolist()
+        global _encode_seconds, _encode_calls
+        key = (self.model_name, self.backend, text)
+        vector = _embedding_cache.get(key)
+        if vector is None:
+            start = time.perf_counter()
+            with span("embed"):
+                vector = tuple(self.model.encode([text], normalize_embeddings=True)[0].tolist())
+            _encode_seconds += time.perf_counter() - start
+            _encode_calls += 1
+            _embedding_cache.put(key, vector)
+        return list(vector)
 
-#def get_retriever(k: int = 5, model_name: str = "all-MiniLM-L6-v2"):
-def get_retriever(k: int = 8, model_name: str = "all-mpnet-base-v2"):
-    embeddings = STEmbeddings(model_name=model_name)
-    vectordb = Chroma(
-        embedding_function=embeddings,
-        persist_directory=CHROMA_DIR,
+
+# =========================
+# Process-wide resource registry
+# =========================
+# The embedding model and the Chroma store are expensive to load, so each is
+# built lazily on first use and then shared by every thread (and therefore
+# every Streamlit session) in the process.
+
+_resources: Dict[Hashable, object] = {}
+_resources_lock = threading.RLock()
+_warm_up_thread: Optional[threading.Thread] = None
+
+
+def shared_resource(key: Hashable, factory: Callable[[], object]):
+    """Return the process-wide instance for `key`, building it on first use."""
+    resource = _resources.get(key)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(key)
+            if resource is None:
+                logger.info(f"Loading shared resource: {key}")
+                resource = factory()
+                _resources[key] = resource
+    return resource
+
+
+def get_embeddings(model_name: str = DEFAULT_MODEL, backend: str = EMBED_BACKEND) -> STEmbeddings:
+    """Shared SentenceTransformer embeddings for `model_name` on `backend`."""
+    return shared_resource(("embeddings", model_name, backend),
+                           lambda: STEmbeddings(model_name=model_name, backend=backend))
+
+
+def release_snapshot(directory: str) -> None:
+    """
+    Forget the shared resources opened on snapshot `directory` and close its
+    Chroma files.
+
+    chromadb caches one System (SQLite connection plus HNSW segments) per
+    persist path for the life of the process, so dropping our references alone
+    keeps the old snapshot's files open. Its System is evicted at once (a
+    reopen gets a fresh one) and stopped after RELEASE_DELAY_SECONDS, so
+    queries still running on the old snapshot can finish.
+    """
+    with _resources_lock:
+        for key in [key for key in _resources if isinstance(key, tuple) and key[1:2] == (directory,)]:
+            del _resources[key]
+    if VECTOR_BACKEND == "numpy":
+        return  # memory-mapped files are unmapped once the last reference goes
+    try:
+        from chromadb.api.client import SharedSystemClient
+        systems = SharedSystemClient._identifier_to_system
+    except (ImportError, AttributeError):
+        return
+    system = systems.pop(directory, None) or systems.pop(os.path.abspath(directory), None)
+    if system is not None:
+        timer = threading.Timer(RELEASE_DELAY_SECONDS, _stop_system, args=(system, directory))
+        timer.daemon = True
+        timer.start()
+
+
+def _stop_system(system, directory: str) -> None:
+    try:
+        system.stop()
+        logger.info(f"Closed Chroma files of old snapshot {directory}")
+    except Exception:
+        logger.warning(f"Could not close Chroma files of old snapshot {directory}", exc_info=True)
+
+
+# =========================
+# Index snapshots
+# =========================
+
+_pointer_memo: Dict[tuple, str] = {}
+
+
+def store_dir() -> str:
+    """Directory of the active index snapshot, from the CURRENT pointer (CHROMA_DIR if there is none)."""
+    try:
+        stat = os.stat(CURRENT_POINTER)
+    except OSError:
+        return CHROMA_DIR
+    # The pointer is replaced, never rewritten in place, so a new inode means a new snapshot
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    directory = _pointer_memo.get(stamp)
+    if directory is None:
+        try:
+            with open(CURRENT_POINTER, "r", encoding="utf-8") as f:
+                name = f.read().strip()
+        except OSError:
+            return CHROMA_DIR
+        directory = os.path.join(SNAPSHOTS_DIR, name) if name else CHROMA_DIR
+        _pointer_memo.clear()
+        _pointer_memo[stamp] = directory
+    return directory
+
+
+def get_collection(directory: Optional[str] = None):
+    """
+    Shared vector collection of a snapshot (default: the active one): the raw
+    chromadb collection, or with RAG_VECTOR_BACKEND=numpy the memory-mapped
+    NumpyIndex exported by ingest.
+    """
+    directory = directory or store_dir()
+    if VECTOR_BACKEND == "numpy":
+        from rag.npindex import INDEX_DIRNAME, NumpyIndex
+        return shared_resource(("npindex", directory),
+                               lambda: NumpyIndex(os.path.join(directory, INDEX_DIRNAME)))
+
+    def _open():
+        import chromadb
+        return chromadb.PersistentClient(path=directory).get_or_create_collection(COLLECTION_NAME)
+    return shared_resource(("collection", directory), _open)
+
+
+def get_vectorstore(model_name: str = DEFAULT_MODEL, directory: Optional[str] = None) -> Chroma:
+    """Shared Chroma vectorstore opened on a snapshot (default: the active one)."""
+    directory = directory or store_dir()
+    return shared_resource(
+        ("vectorstore", directory, model_name),
+        lambda: Chroma(
+            embedding_function=get_embeddings(model_name),
+            persist_directory=directory,
+        ),
     )
-    return vectordb.as_retriever(search_kwargs={"k": k})
+
+
+_version_memo: Dict[tuple, str] = {}
+
+
+def corpus_version(directory: Optional[str] = None) -> str:
+    """
+    Short fingerprint of the indexed corpus, taken from the ingest manifest
+    of a snapshot (default: the active one).
+
+    Changes whenever rag/ingest.py adds, changes, or removes chunks, so caches
+    keyed on it never serve answers built from an older corpus.
+    """
+    path = os.path.join(directory or store_dir(), MANIFEST_FILENAME)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "unversioned"
+    stamp = (path, stat.st_mtime_ns, stat.st_size)
+    version = _version_memo.get(stamp)
+    if version is None:
+        try:
+            with open(path, "rb") as f:
+                version = hashlib.sha256(f.read()).hexdigest()[:16]
+        except OSError:
+            return "unversioned"
+        if len(_version_memo) > 8:
+            _version_memo.clear()
+        _version_memo[stamp] = version
+    return version
+
+
+_MISSING = object()
+
+
+def get_bm25_index(directory: Optional[str] = None) -> Optional[BM25Index]:
+    """Shared BM25 index of a snapshot (default: the active one), or None if ingest has not built one."""
+    directory = directory or store_dir()
+    path = os.path.join(directory, BM25_INDEX_FILENAME)
+
+    def _load():
+        if not os.path.exists(path):
+            logger.warning(f"No BM25 index at {path}; re-run `python -m rag.ingest`. Using dense retrieval only.")
+            return _MISSING
+        return BM25Index.load(path)
+
+    index = shared_resource(("bm25", directory, corpus_version(directory)), _load)
+    return None if index is _MISSING else index
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Chroma retriever with memoised query vectors and search results.
+
+    Repeated queries within a turn (e.g. `retrieve_context` followed by
+    `retrieve_citations`) skip both the encoder and the vector search. With
+    `hybrid=True`, the top `max(fetch_k, k)` dense hits and as many BM25 hits
+    are fused with reciprocal rank fusion before keeping `k`. A metadata
+    `filter` (e.g. {"source_type": "tables"}) applies to both: the BM25 index
+    carries no metadata, so its hits are over-fetched and then checked
+    against the filter in the store.
+    """
+
+    k: int = 8
+    filter: Optional[dict] = None
+    model_name: str = DEFAULT_MODEL
+    hybrid: bool = False
+    fetch_k: int = 20
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Resolved once, so the whole query runs on one snapshot even if a new one goes live meanwhile
+        directory = _check_corpus_version()
+        vector = get_embeddings(self.model_name).embed_query(query)
+        bm25 = get_bm25_index(directory) if self.hybrid else None
+        # Each leg must return at least k candidates, or fusion cannot fill k results
+        fetch_k = max(self.fetch_k, self.k)
+        mode = ("hybrid", fetch_k) if bm25 is not None else ("dense",)
+        key = (directory, hash(tuple(vector)), self.k, repr(sorted((self.filter or {}).items()))) + mode
+        collection = get_collection(directory)
+
+        ids = _search_cache.get(key)
+        if ids is not None:
+            return _fetch_documents(collection, ids)
+
+        if bm25 is None:
+            with span("vector_search"):
+                result = collection.query(
+                    query_embeddings=[vector],
+                    n_results=self.k,
+                    where=self.filter or None,
+                    include=["documents", "metadatas"],
+                )
+            ids = tuple(result["ids"][0])
+            _search_cache.put(key, ids)
+            return _to_documents(ids, result["documents"][0], result["metadatas"][0])
+
+        with span("vector_search"):
+            dense = collection.query(
+                query_embeddings=[vector], n_results=fetch_k, where=self.filter or None, include=[],
+            )["ids"][0]
+        with span("bm25_search"):
+            if self.filter:
+                hits = [cid for cid, _ in bm25.search(query, fetch_k * BM25_FILTER_OVERFETCH)]
+                sparse = _filter_ids(collection, hits, self.filter)[:fetch_k]
+            else:
+                sparse = [cid for cid, _ in bm25.search(query, fetch_k)]
+        ids = tuple(reciprocal_rank_fusion([dense, sparse])[:self.k])
+        _search_cache.put(key, ids)
+        with span("fetch_documents"):
+            return _fetch_documents(collection, ids)
+
+
+def _filter_ids(collection, ids: List[str], where: dict) -> List[str]:
+    """The IDs whose metadata matches `where`, in their original order."""
+    if not ids:
+        return []
+    allowed = set(collection.get(ids=ids, where=where, include=[])["ids"])
+    return [cid for cid in ids if cid in allowed]
+
+
+def _fetch_documents(collection, ids) -> List[Document]:
+    """Load documents by ID, preserving the ranking order of `ids`."""
+    if not ids:
+        return []
+    result = collection.get(ids=list(ids), include=["documents", "metadatas"])
+    by_id = dict(zip(result["ids"], zip(result["documents"], result["metadatas"])))
+    found = [cid for cid in ids if cid in by_id]
+    return _to_documents(found, [by_id[cid][0] for cid in found], [by_id[cid][1] for cid in found])
+
+
+def _to_documents(ids, texts, metadatas) -> List[Document]:
+    return [
+        Document(id=cid, page_content=text or "", metadata=metadata or {})
+        for cid, text, metadata in zip(ids, texts, metadatas)
+    ]
+
+
+#def get_retriever(k: int = 5, model_name: str = "all-MiniLM-L6-v2"):
+def get_retriever(k: int = 8, model_name: str = DEFAULT_MODEL, filter: Optional[dict] = None,
+                  hybrid: Optional[bool] = None):
+    """Shared-resource retriever; `hybrid` defaults to $RAG_HYBRID (off unless set to 1)."""
+    hybrid = HYBRID_DEFAULT if hybrid is None else hybrid
+    return CachedRetriever(k=k, filter=filter, model_name=model_name, hybrid=hybrid)
+
+
+def warm_up(model_name: str = DEFAULT_MODEL, background: bool = True) -> Optional[threading.Thread]:
+    """
+    Load the shared model and vectorstore ahead of the first query.
+
+    With `background=True` the work runs once in a daemon thread and repeated
+    calls (e.g. on every Streamlit rerun) are no-ops.
+    """
+    global _warm_up_thread
+
+    def _load():
+        try:
+            get_collection()
+            get_embeddings(model_name).embed_query("warm-up")
+            from rag.rerank import RERANK_ENABLED, get_cross_encoder
+            if RERANK_ENABLED:
+                get_cross_encoder()
+        except Exception:
+            logger.exception("Retriever warm-up failed; resources will load on first query")
+
+    if not background:
+        _load()
+        return None
+    with _resources_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_load, name="rag-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
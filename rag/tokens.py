@@ -0,0 +1,28 @@
+# rag/tokens.py
+"""Token counting with tiktoken, using the answer model's encoding."""
+
+from functools import lru_cache
+
+TOKEN_MODEL = "gpt-4o-mini"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str = TOKEN_MODEL):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = TOKEN_MODEL) -> int:
+    return len(_encoding(model).encode(text or "", disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = TOKEN_MODEL) -> str:
+    """Cut `text` to at most `max_tokens` tokens."""
+    encoding = _encoding(model)
+    tokens = encoding.encode(text or "", disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(max_tokens, 0)])
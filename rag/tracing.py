@@ -0,0 +1,212 @@
+# rag/tracing.py
+"""
+Structured per-stage tracing and Prometheus-style metrics for the RAG crew.
+
+    with trace_request("direct"):          # one per user query; records "total"
+        with span("embed"):                # any stage inside it
+            ...
+        record_llm_call("direct", seconds, prompt_tokens, completion_tokens)
+
+Every span feeds the `rag_stage_duration_seconds{stage=...}` histogram; LLM
+calls also count calls and prompt/completion tokens per agent. render_metrics()
+returns the Prometheus text exposition (served at GET /metrics by crew/api.py).
+If RAG_TRACE_LOG names a file, each finished request is appended to it as one
+JSON line with all of its spans.
+
+The current trace lives in a contextvar, so spans recorded in worker threads
+started with asyncio.to_thread() still attach to the right request.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_LOG = os.getenv("RAG_TRACE_LOG", "")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, Tuple], List] = {}   # (name, labels) -> [bucket counts..., sum, count]
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_trace_log_lock = threading.Lock()
+
+_current: contextvars.ContextVar = contextvars.ContextVar("rag_trace", default=None)
+
+
+# =========================
+# Metrics
+# =========================
+
+def _labels(**labels) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = (name, _labels(**labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+def _format_labels(labels: Tuple, extra: Optional[Tuple] = None) -> str:
+    pairs = list(labels) + list(extra or ())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render_metrics() -> str:
+    """All counters and histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(value)) for key, value in _histograms.items())
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), hist in histograms:
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        for bound, count in zip(BUCKETS, hist):
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {hist[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# Traces and spans
+# =========================
+
+class _Trace:
+    def __init__(self, mode: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.mode = mode
+        self.start = time.time()
+        self.spans: List[Dict] = []
+        self.attrs: Dict = {}
+
+
+@contextlib.contextmanager
+def trace_request(mode: str, **attrs):
+    """Trace one user request; records the "total" stage and writes the JSON trace line."""
+    with detached_trace(mode, **attrs) as trace, use_trace(trace):
+        yield trace
+
+
+@contextlib.contextmanager
+def detached_trace(mode: str, **attrs):
+    """
+    Like trace_request(), but without making the trace current.
+
+    For async generators: a context variable they set stays set in the
+    consumer between yields, so they enter use_trace(trace) around each step
+    instead of holding the trace across a `yield`.
+    """
+    if _current.get() is not None:
+        yield _current.get()  # nested (e.g. kickoff_query called from the service): one trace only
+        return
+    trace = _Trace(mode)
+    trace.attrs.update(attrs)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        observe("rag_stage_duration_seconds", duration, stage="total")
+        inc("rag_requests_total", mode=trace.attrs.get("mode", mode),
+            cached=trace.attrs.get("cached", False), status=status)
+        trace.spans.append({"stage": "total", "seconds": duration})
+        if TRACE_LOG:
+            _write_trace(trace, status)
+
+
+@contextlib.contextmanager
+def use_trace(trace: Optional[_Trace]):
+    """Make `trace` the current trace for the block; spans and annotations go to it."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # block finished in another context (e.g. a generator closed by the garbage collector)
+
+
+def annotate(**attrs) -> None:
+    """Attach attributes (e.g. cached=True, mode="crew") to the current trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def record_span(stage: str, seconds: float, **attrs) -> None:
+    """Record a stage whose duration was measured by the caller."""
+    observe("rag_stage_duration_seconds", seconds, stage=stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append({"stage": stage, "seconds": seconds, **attrs})
+
+
+@contextlib.contextmanager
+def span(stage: str, **attrs):
+    """Time one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start, **attrs)
+
+
+def record_llm_call(agent: str, seconds: float, prompt_tokens: int, completion_tokens: int) -> None:
+    """Record one LLM round trip made on behalf of `agent`."""
+    record_span(f"llm:{agent}", seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    inc("rag_llm_calls_total", agent=agent)
+    inc("rag_llm_tokens_total", prompt_tokens, agent=agent, type="prompt")
+    inc("rag_llm_tokens_total", completion_tokens, agent=agent, type="completion")
+
+
+def _write_trace(trace: _Trace, status: str) -> None:
+    record = {
+        "trace_id": trace.id,
+        "timestamp": trace.start,
+        "mode": trace.mode,
+        "status": status,
+        **trace.attrs,
+        "spans": trace.spans,
+    }
+    try:
+        with _trace_log_lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write trace log {TRACE_LOG}: {e}")
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Import the project packages (crew, rag, bench) however pytest is invoked
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
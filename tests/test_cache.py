@@ -0,0 +1,59 @@
+# tests/test_cache.py
+import pytest
+
+cache_module = pytest.importorskip("crew.cache")
+
+from crew.cache import AnswerCache, normalize_query, query_anchors
+
+
+class _SameVector:
+    """Embeds every query to the same unit vector, so only the anchors and scope tell them apart."""
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+
+@pytest.fixture
+def corpus(monkeypatch):
+    state = {"version": "v1"}
+    monkeypatch.setattr(cache_module, "get_embeddings", lambda: _SameVector())
+    monkeypatch.setattr(cache_module, "corpus_version", lambda: state["version"])
+    return state
+
+
+@pytest.fixture
+def cache(tmp_path, corpus):
+    return AnswerCache(path=str(tmp_path / "answers.sqlite3"))
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   the Budget?? ") == "what is the budget"
+
+
+def test_query_anchors_keep_numbers_and_names():
+    assert query_anchors("What is the plan?") == ""
+    assert query_anchors("What happens in phase 1?") != query_anchors("What happens in phase 2?")
+    assert query_anchors("Funding in Ontario") != query_anchors("Funding in Quebec")
+
+
+def test_entries_are_scoped_by_mode_directive_and_corpus(cache, corpus):
+    cache.store("What is the plan?", "policy", "direct", "answer")
+    assert cache.lookup("what is the plan", "policy", "direct") == "answer"
+    assert cache.lookup("What is the plan?", "policy", "crew") is None
+    assert cache.lookup("What is the plan?", "research", "direct") is None
+    corpus["version"] = "v2"
+    assert cache.lookup("What is the plan?", "policy", "direct") is None
+
+
+def test_near_duplicates_must_share_anchors(cache):
+    cache.store("What is the budget for phase 1?", "policy", "direct", "phase one")
+    assert cache.lookup("Tell me the budget for phase 1", "policy", "direct") == "phase one"
+    assert cache.lookup("What is the budget for phase 2?", "policy", "direct") is None
+
+
+def test_entries_persist_across_instances(tmp_path, corpus):
+    path = str(tmp_path / "answers.sqlite3")
+    AnswerCache(path=path).store("What is the plan?", "policy", "direct", "answer")
+    fresh = AnswerCache(path=path)
+    assert fresh.lookup("What is the plan?", "policy", "direct") == "answer"
+    assert fresh.stats()["disk_hits"] == 1
@@ -0,0 +1,102 @@
+# tests/test_ingest.py
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+ingest = pytest.importorskip("rag.ingest")
+chromadb = pytest.importorskip("chromadb")
+
+from langchain_core.documents import Document
+
+REPORT = "chatbot Report.pdf"
+
+
+def _parse_lines(pdf_path):
+    """Stands in for PDF parsing: every line of the (text) file is one chunk on its own page."""
+    lines = Path(pdf_path).read_text(encoding="utf-8").splitlines()
+    chunks = [Document(page_content=line, metadata={"source": Path(pdf_path).name, "page": page})
+              for page, line in enumerate(lines, start=1)]
+    return len(lines), chunks
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An isolated data/ folder and snapshot store; returns the data folder and the embedded texts."""
+    data = tmp_path / "data"
+    data.mkdir()
+    root = tmp_path / "vectorstore"
+    pointer = root / "CURRENT"
+    embedded = []
+
+    class Embeddings:
+        def __init__(self, model_name=None, backend=None):
+            pass
+
+        def embed_documents(self, texts):
+            embedded.extend(texts)
+            return [[float(len(text)), float(sum(map(ord, text)) % 101), 1.0] for text in texts]
+
+    def store_dir():
+        if pointer.exists():
+            return str(root / "snapshots" / pointer.read_text(encoding="utf-8").strip())
+        return str(root)
+
+    monkeypatch.setattr(ingest, "DATA_DIR", data)
+    monkeypatch.setattr(ingest, "SNAPSHOTS_DIR", str(root / "snapshots"))
+    monkeypatch.setattr(ingest, "CURRENT_POINTER", str(pointer))
+    monkeypatch.setattr(ingest, "store_dir", store_dir)
+    monkeypatch.setattr(ingest, "STEmbeddings", Embeddings)
+    monkeypatch.setattr(ingest, "_parse_pdf", _parse_lines)
+    # Threads see the patched parser; worker processes might not
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", ThreadPoolExecutor)
+    return data, embedded, store_dir
+
+
+def _stored(directory):
+    collection = chromadb.PersistentClient(path=directory).get_collection(ingest.COLLECTION_NAME)
+    stored = collection.get(include=["documents", "metadatas"])
+    return {text: meta for text, meta in zip(stored["documents"], stored["metadatas"])}
+
+
+def test_incremental_ingest_only_embeds_changed_chunks(store):
+    data, embedded, store_dir = store
+    (data / REPORT).write_text("alpha\nbravo\ncharlie\n", encoding="utf-8")
+    ingest.build_vectorstore(embed_threads=1)
+    assert sorted(embedded) == ["alpha", "bravo", "charlie"]
+    first = store_dir()
+
+    # Nothing changed: no parsing, no embedding and no new snapshot
+    embedded.clear()
+    ingest.build_vectorstore(embed_threads=1)
+    assert embedded == []
+    assert store_dir() == first
+
+    # One chunk added, one removed, and the unchanged ones moved to other pages
+    (data / REPORT).write_text("delta\nalpha\ncharlie\n", encoding="utf-8")
+    ingest.build_vectorstore(embed_threads=1)
+    assert embedded == ["delta"]
+    assert store_dir() != first
+    stored = _stored(store_dir())
+    assert set(stored) == {"delta", "alpha", "charlie"}
+    assert stored["alpha"]["page"] == 2  # unchanged chunk, metadata rewritten
+    assert stored["charlie"]["page"] == 3
+
+
+def test_rebuild_embeds_everything_again(store):
+    data, embedded, store_dir = store
+    (data / REPORT).write_text("alpha\nbravo\n", encoding="utf-8")
+    ingest.build_vectorstore(embed_threads=1)
+    embedded.clear()
+    ingest.build_vectorstore(rebuild=True, embed_threads=1)
+    assert sorted(embedded) == ["alpha", "bravo"]
+    assert set(_stored(store_dir())) == {"alpha", "bravo"}
+
+
+def test_worker_counts_must_be_positive(store):
+    data, _, _ = store
+    (data / REPORT).write_text("alpha\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        ingest.build_vectorstore(embed_threads=0)
+    with pytest.raises(ValueError):
+        ingest.build_vectorstore(parse_workers=0)
@@ -0,0 +1,51 @@
+# tests/test_packing.py
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from rag.packing import _Passage, _try_merge
+
+TEXT = "".join(f"sentence {i:02d}. " for i in range(20))  # 260 characters, no repeats
+
+
+def passage(start, end, rank=0, offsets=True):
+    return _Passage("report.pdf", rank, start if offsets else None, TEXT[start:end])
+
+
+def test_overlapping_offsets_are_merged():
+    a, b = passage(0, 120, rank=3), passage(80, 200, rank=1)
+    assert _try_merge(a, b)
+    assert a.text == TEXT[0:200]
+    assert a.rank == 1
+
+
+def test_chunk_inside_another_is_dropped_when_its_text_agrees():
+    a, b = passage(0, 200), passage(40, 120, rank=5)
+    assert _try_merge(a, b)
+    assert a.text == TEXT[0:200]
+
+
+def test_stale_offsets_never_drop_different_text():
+    a = passage(0, 200)
+    b = _Passage("report.pdf", 1, 40, "a chunk whose offsets claim it lies inside the first one")
+    assert not _try_merge(a, b)
+    assert a.text == TEXT[0:200]
+
+
+def test_adjacent_chunks_are_joined():
+    a, b = passage(0, 100), passage(101, 200)
+    assert _try_merge(a, b)
+    assert a.text == TEXT[0:100] + " " + TEXT[101:200]
+
+
+def test_distant_chunks_are_not_merged():
+    a, b = passage(0, 100), passage(150, 250)
+    assert not _try_merge(a, b)
+    assert a.text == TEXT[0:100]
+
+
+@pytest.mark.parametrize("first, second", [((0, 120), (80, 200)), ((80, 200), (0, 120))])
+def test_text_overlap_merges_without_offsets(first, second):
+    a, b = passage(*first, offsets=False), passage(*second, offsets=False)
+    assert _try_merge(a, b)
+    assert a.text == TEXT[0:200]
@@ -0,0 +1,98 @@
+# tests/test_service.py
+import asyncio
+
+import pytest
+
+service_module = pytest.importorskip("crew.service")
+
+from crew.service import QueryService
+
+
+class _Client:
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Stubs out retrieval, the LLM and every store; `llm` records the calls and can block them."""
+    state = {"calls": 0, "cancelled": 0, "release": None}
+
+    async def achat(messages, client, llm=None, agent="direct"):
+        state["calls"] += 1
+        try:
+            await state["release"].wait()
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        return f"answer to {messages[0]}"
+
+    monkeypatch.setattr(service_module, "make_async_client", _Client)
+    monkeypatch.setattr(service_module, "direct_messages", lambda query, directive, conversation=None: ([query], ["c1"]))
+    monkeypatch.setattr(service_module, "achat", achat)
+    monkeypatch.setattr(service_module, "remember_turn", lambda *args: None)
+    monkeypatch.setattr(service_module, "get_answer_cache", lambda: None)
+    monkeypatch.setattr(service_module, "_find_precomputed", lambda query, directive: None)
+    return state
+
+
+def test_identical_queries_share_one_execution(llm):
+    async def main():
+        llm["release"] = asyncio.Event()
+        service = QueryService(max_concurrency=2)
+        first = asyncio.ensure_future(service.run("What is the plan?", "policy", mode="direct"))
+        second = asyncio.ensure_future(service.run("what is the plan", "policy", mode="direct"))
+        other = asyncio.ensure_future(service.run("What is the plan?", "research", mode="direct"))
+        await asyncio.sleep(0.05)
+        llm["release"].set()
+        results = await asyncio.gather(first, second, other)
+        await service.aclose()
+        return results, service.stats()
+
+    (first, second, other), stats = asyncio.run(main())
+    assert first.answer == second.answer
+    assert first.chunk_ids == ["c1"]
+    assert llm["calls"] == 2  # the identical pair once, the other directive separately
+    assert stats["in_flight"] == 0
+
+
+def test_execution_stops_when_every_caller_cancels(llm):
+    async def main():
+        llm["release"] = asyncio.Event()
+        service = QueryService(max_concurrency=1)
+        callers = [asyncio.ensure_future(service.run("What is the plan?", "policy", mode="direct"))
+                   for _ in range(2)]
+        await asyncio.sleep(0.05)
+        callers[0].cancel()
+        await asyncio.sleep(0.05)
+        assert llm["cancelled"] == 0  # one caller is still waiting for the answer
+        callers[1].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        # The slot is free again for the next query
+        llm["release"].set()
+        result = await asyncio.wait_for(service.run("Another question", "policy", mode="direct"), timeout=1)
+        await service.aclose()
+        return result, service.stats()
+
+    result, stats = asyncio.run(main())
+    assert llm["cancelled"] == 1
+    assert result.answer == "answer to Another question"
+    assert stats == {"queued": 0, "in_flight": 0, "abandoned_runs": 0}
+
+
+def test_one_caller_cancelling_does_not_stop_the_others(llm):
+    async def main():
+        llm["release"] = asyncio.Event()
+        service = QueryService(max_concurrency=1)
+        leaving = asyncio.ensure_future(service.run("What is the plan?", "policy", mode="direct"))
+        staying = asyncio.ensure_future(service.run("What is the plan?", "policy", mode="direct"))
+        await asyncio.sleep(0.05)
+        leaving.cancel()
+        llm["release"].set()
+        result = await staying
+        await service.aclose()
+        return result
+
+    assert asyncio.run(main()).answer == "answer to What is the plan?"
+    assert llm["calls"] == 1 and llm["cancelled"] == 0